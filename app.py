@@ -1,6 +1,5 @@
 
 from sqlalchemy.orm import sessionmaker, joinedload
-from sqlalchemy import create_engine
 from sqlalchemy.sql import exists
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify
 
@@ -12,13 +11,14 @@ from openpyxl.styles import Alignment
 import os
 import subprocess
 from werkzeug.security import check_password_hash
-from config import ADMIN_PASSWORD_HASH,ADMIN_USERNAME
+from config import ADMIN_PASSWORD_HASH,ADMIN_USERNAME,DISTRIBUTION_SCORING_MODE
 import json
 from decorators import role_required
+from factories import get_engine
 
 app = Flask(__name__, template_folder='templates')
 app.secret_key = 'key'
-engine = create_engine('sqlite:///database.db')
+engine = get_engine('sqlite:///database.db')
 DBSession = sessionmaker(bind=engine)
 distribution_repository = DistributionRepository(engine)
 student_repository = StudentRepository(engine)
@@ -28,6 +28,49 @@ subject_repository = SubjectRepository(engine)
 adviser_theme_repository = AdviserThemeRepository(engine,adviser_repository, theme_repository)
 student_theme_interest_repository = StudentThemeInterestRepository(engine,student_repository,theme_repository)
 theme_subject_importance_repository = ThemeSubjectImportanceRepository(engine, theme_repository, subject_repository)
+student_subject_grade_repository = StudentSubjectGradeRepository(engine, student_repository, subject_repository)
+distribution_algorithm_repository = DistributionAlgorithmRepository(engine, student_subject_grade_repository,
+                                                                    student_theme_interest_repository,
+                                                                    theme_subject_importance_repository,
+                                                                    adviser_theme_repository, distribution_repository,
+                                                                    scoring_mode=DISTRIBUTION_SCORING_MODE)
+
+
+def page_arguments():
+    """Читает курсор after, размер страницы limit и порядок order из строки запроса."""
+    after_id = request.args.get("after", type=int)
+    limit = min(max(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    order = request.args.get("order", "asc")
+    if order not in PAGE_ORDERS:
+        order = "asc"
+    return after_id, limit, order
+
+
+def render_page(template, repository, model, name, options=(), columns=()):
+    """
+    Отображает страницу списка записей модели со ссылкой на следующую страницу.
+    Если указаны columns, в шаблон передаются только эти столбцы, без ORM-объектов.
+    """
+    after_id, limit, order = page_arguments()
+    records, next_cursor = repository.get_page(model, after_id, limit, order, options=options, columns=columns)
+    return render_template(template, **{name: records}, after_id=after_id, next_cursor=next_cursor,
+                           limit=limit, order=order)
+
+
+def json_list(repository, model, columns, serialize):
+    """
+    Отдает столбцы columns записей модели списком JSON. Если в запросе указан limit, отдается одна страница,
+    а ссылка на следующую передается в заголовке Link (rel="next").
+    """
+    if "limit" not in request.args:
+        return jsonify([serialize(row) for row in repository.get_columns(model, *columns)]), 200
+    after_id, limit, order = page_arguments()
+    records, next_cursor = repository.get_page(model, after_id, limit, order, columns=columns)
+    response = jsonify([serialize(record) for record in records])
+    if next_cursor is not None:
+        next_url = url_for(request.endpoint, after=next_cursor, limit=limit, order=order)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response, 200
 
 
 @app.route('/')
@@ -38,13 +81,10 @@ def home():
 @app.route('/index')
 @role_required('admin')
 def index():
-    with DBSession() as session:
-        distributions = (session.query(Distribution).options(
-            joinedload(Distribution.student),
-            joinedload(Distribution.adviser),
-            joinedload(Distribution.theme)).all()
-        )
-    return render_template('index.html', distributions=distributions)
+    return render_page('index.html', distribution_repository, Distribution, 'distributions', options=(
+        joinedload(Distribution.student),
+        joinedload(Distribution.adviser),
+        joinedload(Distribution.theme)))
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -74,12 +114,9 @@ def login():
 @role_required('admin')
 def get_adviser_theme_assignments():
     try:
-        assignments = adviser_theme_repository.get_all(AdviserTheme)
-        result = [
-            {"adviser_id": assignment.adviser_id, "theme_id": assignment.theme_id}
-            for assignment in assignments
-        ]
-        return jsonify(result), 200
+        return json_list(adviser_theme_repository, AdviserTheme, ("adviser_id", "theme_id"), lambda assignment: {
+            "adviser_id": assignment.adviser_id, "theme_id": assignment.theme_id
+        })
     except Exception as e:
         logging.error(f"Ошибка при получении назначений: {e}")
         return jsonify({"error": str(e)}), 500
@@ -127,7 +164,7 @@ def assign_importances():
 @role_required('admin')
 def assign_advisers_to_themes():
     if request.method == 'GET':
-        assignments = adviser_theme_repository.get_all(AdviserTheme)
+        assignments = adviser_theme_repository.get_columns(AdviserTheme, "adviser_id", "theme_id")
 
         grouped_assignments = {}
         for assignment in assignments:
@@ -135,8 +172,8 @@ def assign_advisers_to_themes():
                 grouped_assignments[assignment.adviser_id] = []
             grouped_assignments[assignment.adviser_id].append(assignment.theme_id)
 
-        advisers = adviser_repository.get_all(Adviser)
-        themes = theme_repository.get_all(Theme)
+        advisers = adviser_repository.get_columns(Adviser, "adviser_id", "firstname", "lastname", "patronymic")
+        themes = theme_repository.get_columns(Theme, "theme_id", "theme_name")
 
         # Передаем данные в шаблон
         return render_template(
@@ -198,9 +235,8 @@ def assign_advisers_to_themes():
 @role_required('admin')
 def get_subjects():
     try:
-        subjects = subject_repository.get_all(Subject)
-        list_subjects = [{'id': subject.subject_id, 'name': subject.subject_name} for subject in subjects]
-        return jsonify(list_subjects),200
+        return json_list(subject_repository, Subject, ("subject_id", "subject_name"),
+                         lambda subject: {'id': subject.subject_id, 'name': subject.subject_name})
     except Exception as e:
         logging.error(f"Ошибка при получении предметов:{e}")
         return f"Произошла ошибка{e}",500
@@ -210,9 +246,8 @@ def get_subjects():
 @role_required('admin')
 def get_themes():
     try:
-        themes = theme_repository.get_all(Theme)
-        themes_list = [{"id": theme.theme_id, "name": theme.theme_name} for theme in themes]
-        return jsonify(themes_list), 200
+        return json_list(theme_repository, Theme, ("theme_id", "theme_name"),
+                         lambda theme: {"id": theme.theme_id, "name": theme.theme_name})
     except Exception as e:
         logging.error(f"Ошибка при получении тем: {e}")
         return f"Произошла ошибка: {e}", 500
@@ -222,16 +257,11 @@ def get_themes():
 @role_required('admin')
 def get_advisers():
     try:
-        advisers = adviser_repository.get_all(Adviser)
-        advisers_list = [
-            {
-                "id": adviser.adviser_id,
-                "firstname": adviser.firstname,
-                "lastname": adviser.lastname,
-            }
-            for adviser in advisers
-        ]
-        return jsonify(advisers_list), 200
+        return json_list(adviser_repository, Adviser, ("adviser_id", "firstname", "lastname"), lambda adviser: {
+            "id": adviser.adviser_id,
+            "firstname": adviser.firstname,
+            "lastname": adviser.lastname,
+        })
     except Exception as e:
         logging.error(f"Ошибка при получении научных руководителей: {e}")
         return jsonify({"error": str(e)}), 500
@@ -241,16 +271,12 @@ def get_advisers():
 @role_required('admin')
 def get_theme_subject_importances():
     try:
-        importances = theme_subject_importance_repository.get_all(ThemeSubjectImportance)
-        importances_list = [
-            {
-                "theme_id": importance.theme_id,
-                "subject_id": importance.subject_id,
-                "weight": round(importance.weight,2)
-            }
-            for importance in importances
-        ]
-        return jsonify(importances_list), 200
+        columns = ("theme_id", "subject_id", "weight")
+        return json_list(theme_subject_importance_repository, ThemeSubjectImportance, columns, lambda importance: {
+            "theme_id": importance.theme_id,
+            "subject_id": importance.subject_id,
+            "weight": round(importance.weight, 2)
+        })
     except Exception as e:
         logging.error(f"Ошибка при получении связей тем и предметов: {e}")
         return f"Произошла ошибка: {e}", 500
@@ -259,27 +285,26 @@ def get_theme_subject_importances():
 @app.route("/students")
 @role_required('admin')
 def display_students():
-    students = student_repository.get_all(Student)
-    return render_template('student_data.html', students=students)
+    return render_page('student_data.html', student_repository, Student, 'students',
+                       columns=("student_id", "lastname", "firstname", "patronymic", "group_student"))
 
 
 @app.route("/advisers")
 @role_required('admin')
 def display_advisers():
-    advisers = adviser_repository.get_all(Adviser)
-    return render_template("adviser_data.html", advisers=advisers)
+    return render_page("adviser_data.html", adviser_repository, Adviser, "advisers",
+                       columns=("adviser_id", "firstname", "lastname", "patronymic", "number_of_places"))
 
 
 @app.route("/themes")
 @role_required('admin')
 def display_themes():
-    themes = theme_repository.get_all(Theme)
-    return render_template("theme_data.html", themes=themes)
+    return render_page("theme_data.html", theme_repository, Theme, "themes", columns=("theme_id", "theme_name"))
 
 
 @app.route("/form_student")
 def form_student():
-    themes = theme_repository.get_all(Theme)
+    themes = theme_repository.get_columns(Theme, "theme_id", "theme_name")
     return render_template("form_student.html",themes=themes)
 
 
@@ -320,6 +345,13 @@ def save_priorities():
             db_session.commit()
             student_theme_interest_repository.display_all_student_theme_interests()
 
+        # Обновляем уже сохраненное распределение только для этого студента. Приоритеты уже сохранены,
+        # поэтому ошибка обновления не отменяет ответ: распределение исправит следующий полный запуск
+        try:
+            distribution_algorithm_repository.repair_distribution_for_student(int(student_id))
+        except Exception as e:
+            logging.error(f"Ошибка при обновлении распределения Студента ID {student_id}: {e}")
+
         return "Приоритеты успешно сохранены!", 200
 
     except json.JSONDecodeError:
@@ -581,6 +613,8 @@ def run_main():
                             capture_output=True, text=True)
     if result.returncode != 0:
         print("Error:", result.stderr)
+    # main.py пересоздает базу в другом процессе, кэш справочных данных этого процесса устарел
+    reference_cache.clear()
     return redirect(url_for('index'))
 
 
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Число записей в кэше справочных данных и срок их жизни в секундах
+REFERENCE_CACHE_SIZE = 64
+REFERENCE_CACHE_TTL = 60.0
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш в памяти процесса: при переполнении вытесняется давно не использованная
+    запись (LRU), запись старше ttl секунд считается отсутствующей.
+    Значения отдаются всем вызывающим как есть, поэтому в кэше хранятся только неизменяемые данные
+    (в репозиториях — строки get_columns, но не ORM-объекты).
+
+    Срок жизни ограничивает устаревание данных, измененных в обход кэша (например, другим процессом);
+    изменения через репозитории сбрасывают записи сразу через invalidate.
+    Запись может быть помечена тегом, тогда invalidate(tag) сбрасывает все записи с этим тегом.
+    """
+
+    def __init__(self, maxsize=REFERENCE_CACHE_SIZE, ttl=REFERENCE_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (срок действия, значение, тег)
+        self._generations = {}  # тег -> номер последнего сброса
+        self._epoch = 0  # номер последнего полного сброса
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader, tag=None):
+        """
+        Возвращает значение по ключу, при отсутствии или истечении срока вызывает loader() и сохраняет результат.
+        Загрузка выполняется без блокировки; если во время нее тег был сброшен, результат не сохраняется.
+
+        :param tag: Тег записи для invalidate; по умолчанию тегом служит сам ключ.
+        """
+        tag = key if tag is None else tag
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                return entry[1]
+            generation = (self._epoch, self._generations.get(tag, 0))
+
+        value = loader()
+
+        with self._lock:
+            if (self._epoch, self._generations.get(tag, 0)) == generation:
+                self._entries[key] = (self.clock() + self.ttl, value, tag)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *tags):
+        """Сбрасывает записи с указанными тегами."""
+        tags = set(tags)
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in [key for key, entry in self._entries.items() if entry[2] in tags]:
+                del self._entries[key]
+
+    def clear(self):
+        """Сбрасывает все записи."""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
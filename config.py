@@ -2,6 +2,13 @@ from werkzeug.security import generate_password_hash
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD_HASH = generate_password_hash("admin_password")
 
+# Алгоритм распределения из реестра solvers.SOLVERS: "greedy", "min_cost_flow", "deferred_acceptance"
+DISTRIBUTION_SOLVER = "greedy"
+# Время в секундах на улучшение распределения локальным поиском; None — без улучшения
+DISTRIBUTION_IMPROVE_TIME_BUDGET = None
+# Способ расчета подходимости: "matrix", "sql" или "store" (сохраненные оценки с пересчетом измененных)
+DISTRIBUTION_SCORING_MODE = "matrix"
+
 
 stud_logins = ["student" + str(i) for i in range(50)]
 stud_passwords = [generate_password_hash("password" + str(i)) for i in range(50)]
@@ -1,5 +1,7 @@
+import threading
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from migrations import ensure_indexes
 from models import Base
 from repositories import (
     StudentRepository,
@@ -14,70 +16,109 @@ from repositories import (
     DistributionAlgorithmRepository
 )
 
+# Рабочий профиль SQLite: WAL позволяет читать во время записи распределения,
+# synchronous=NORMAL в режиме WAL не теряет целостность, но не делает fsync на каждый коммит
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -64000),  # 64 МБ страничного кэша
+    ("mmap_size", 268435456),  # 256 МБ
+    ("busy_timeout", 5000),  # мс ожидания блокировки вместо ошибки "database is locked"
+)
+
+# Движки процесса по URL базы: один пул соединений и одно создание схемы на базу
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Применяет SQLITE_PRAGMAS к каждому новому соединению SQLite."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def get_engine(db_url, **engine_options):
+    """
+    Возвращает общий для процесса движок для db_url, создавая его при первом обращении.
+    Для SQLite соединения настраиваются через SQLITE_PRAGMAS; схема создается (и в существующую базу
+    добавляются недостающие индексы) один раз на движок.
+    """
+    with _engines_lock:
+        engine = _engines.get(db_url)
+        if engine is None:
+            engine = create_engine(db_url, **engine_options)
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", apply_sqlite_pragmas)
+            Base.metadata.create_all(engine)
+            ensure_indexes(engine)
+            _engines[db_url] = engine
+        return engine
+
+
+def dispose_engines():
+    """Закрывает пулы соединений всех движков реестра и очищает его."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
 class RepositoryFactory:
     @staticmethod
     def create_student_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return StudentRepository(engine)
+        return StudentRepository(get_engine(db_url))
 
     @staticmethod
     def create_adviser_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return AdviserRepository(engine)
+        return AdviserRepository(get_engine(db_url))
 
     @staticmethod
     def create_subject_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return SubjectRepository(engine)
+        return SubjectRepository(get_engine(db_url))
 
     @staticmethod
     def create_theme_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return ThemeRepository(engine)
+        return ThemeRepository(get_engine(db_url))
 
     @staticmethod
     def create_adviser_theme_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return AdviserThemeRepository(engine, adviser_repository=AdviserRepository, theme_repository=ThemeRepository)
+        return AdviserThemeRepository(get_engine(db_url),
+                                      adviser_repository=RepositoryFactory.create_adviser_repository(db_url),
+                                      theme_repository=RepositoryFactory.create_theme_repository(db_url))
 
     @staticmethod
     def create_student_subject_grade_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return StudentSubjectGradeRepository(engine,student_repository=StudentRepository,subject_repository=SubjectRepository)
+        return StudentSubjectGradeRepository(get_engine(db_url),
+                                             student_repository=RepositoryFactory.create_student_repository(db_url),
+                                             subject_repository=RepositoryFactory.create_subject_repository(db_url))
 
     @staticmethod
     def create_student_theme_interest_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return StudentThemeInterestRepository(engine, student_repository=StudentRepository,theme_repository=ThemeRepository)
+        return StudentThemeInterestRepository(get_engine(db_url),
+                                              student_repository=RepositoryFactory.create_student_repository(db_url),
+                                              theme_repository=RepositoryFactory.create_theme_repository(db_url))
 
     @staticmethod
     def create_theme_subject_importance_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return ThemeSubjectImportanceRepository(engine, theme_repository=ThemeRepository,subject_repository=SubjectRepository)
+        return ThemeSubjectImportanceRepository(get_engine(db_url),
+                                                theme_repository=RepositoryFactory.create_theme_repository(db_url),
+                                                subject_repository=RepositoryFactory.create_subject_repository(db_url))
 
     @staticmethod
     def create_distribution_algorithm_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return DistributionAlgorithmRepository(engine,
-                                      distribution_repository=DistributionRepository,
-                                      student_subject_grade_repository=StudentSubjectGradeRepository,
-                                      student_theme_interest_repository= StudentThemeInterestRepository,
-                                      theme_subject_importance_repository= ThemeSubjectImportanceRepository,
-                                      adviser_theme_repository=AdviserThemeRepository
-                                      )
+        return DistributionAlgorithmRepository(
+            get_engine(db_url),
+            distribution_repository=RepositoryFactory.create_distribution_repository(db_url),
+            student_subject_grade_repository=RepositoryFactory.create_student_subject_grade_repository(db_url),
+            student_theme_interest_repository=RepositoryFactory.create_student_theme_interest_repository(db_url),
+            theme_subject_importance_repository=RepositoryFactory.create_theme_subject_importance_repository(db_url),
+            adviser_theme_repository=RepositoryFactory.create_adviser_theme_repository(db_url)
+        )
 
     @staticmethod
     def create_distribution_repository(db_url):
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        return DistributionRepository(engine)
-
+        return DistributionRepository(get_engine(db_url))
@@ -1,17 +1,18 @@
-from sqlalchemy import create_engine
 from models import Base
+from factories import get_engine
 from repositories import (StudentRepository, SubjectRepository, ThemeRepository, AdviserRepository,
                           StudentSubjectGradeRepository, StudentThemeInterestRepository,
                           ThemeSubjectImportanceRepository, AdviserThemeRepository, DistributionRepository,
                           DistributionAlgorithmRepository)
 import random as rnd
 from models import *
-from config import stud_logins, stud_passwords, adviser_logins, adviser_passwords
+from config import (stud_logins, stud_passwords, adviser_logins, adviser_passwords, DISTRIBUTION_SOLVER,
+                    DISTRIBUTION_IMPROVE_TIME_BUDGET, DISTRIBUTION_SCORING_MODE)
 from data import advisers_with_credentials
 
 
 def main():
-    engine = create_engine('sqlite:///database.db')
+    engine = get_engine('sqlite:///database.db')
 
     Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
@@ -27,7 +28,8 @@ def main():
     adviser_theme_repository = AdviserThemeRepository(engine, adviser_repository, theme_repository)
     distribution_repository = DistributionRepository(engine)
     distribution_algorithm_repository = DistributionAlgorithmRepository(engine, student_subject_grade_repository, student_theme_interest_repository,
-                                      theme_subject_importance_repository, adviser_theme_repository, distribution_repository)
+                                      theme_subject_importance_repository, adviser_theme_repository, distribution_repository,
+                                      scoring_mode=DISTRIBUTION_SCORING_MODE)
 
     # Очищаем репозитории
     student_repository.delete_all(Student)
@@ -51,15 +53,17 @@ def main():
     subjects = subject_repository.get_all(Subject)
     themes = theme_repository.get_all(Theme)
 
-    for student in students:
-        for subject in subjects:
-            grade = rnd.randint(3, 5)
-            student_subject_grade_repository.add_student_subject_grade(student.student_id, subject.subject_id, grade)
+    student_subject_grade_repository.bulk_insert(StudentSubjectGrade, (
+        {"student_id": student.student_id, "subject_id": subject.subject_id, "grade": rnd.randint(3, 5)}
+        for student in students
+        for subject in subjects
+    ))
 
-    for theme in themes:
-        for subject in subjects:
-            weight = rnd.uniform(0.1, 1)
-            theme_subject_importance_repository.add_theme_subject_importance(theme.theme_id, subject.subject_id, weight)
+    theme_subject_importance_repository.bulk_upsert(ThemeSubjectImportance, (
+        {"theme_id": theme.theme_id, "subject_id": subject.subject_id, "weight": rnd.uniform(0.1, 1)}
+        for theme in themes
+        for subject in subjects
+    ), key_columns=("theme_id", "subject_id"))
 
     #добавление тем научным руководителям
     adviser_theme_repository.add_adviser_themes(1, *[1])
@@ -98,7 +102,8 @@ def main():
     # print("\nВеса предметов по темам:")
     # theme_subject_importance_repository.display_all_theme_subject_importances()
 
-    unassigned_students = distribution_algorithm_repository.assign_students_to_advisers_and_distribute()
+    unassigned_students = distribution_algorithm_repository.assign_students_to_advisers_and_distribute(
+        solver=DISTRIBUTION_SOLVER, improve_time_budget=DISTRIBUTION_IMPROVE_TIME_BUDGET)
 
     print("\nИтоговые распределения")
     distribution_repository.display_all_distributions()
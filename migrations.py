@@ -0,0 +1,46 @@
+import logging
+
+from sqlalchemy import func, inspect, select
+
+from models import SUITABILITY_SOURCE_MODELS, Base, SuitabilityScore
+
+logger = logging.getLogger(__name__)
+
+
+def deduplicate(connection, table, key_columns):
+    """
+    Удаляет повторы естественного ключа, оставляя последнюю добавленную запись (с наибольшим первичным ключом).
+    :return: Количество удаленных строк.
+    """
+    primary_key = next(iter(table.primary_key.columns))
+    latest = select(func.max(primary_key)).group_by(*(table.c[name] for name in key_columns))
+    return connection.execute(table.delete().where(primary_key.notin_(latest.scalar_subquery()))).rowcount
+
+
+def ensure_indexes(engine):
+    """
+    Добавляет индексы моделей в существующую базу: create_all не меняет уже созданные таблицы.
+    Перед созданием индекса уникальности из таблицы удаляются повторы его ключа.
+    """
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        existing_indexes = {
+            table_name: {index["name"] for index in inspector.get_indexes(table_name)}
+            for table_name in existing_tables
+        }
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in existing_indexes[table.name]:
+                    continue
+                if index.unique:
+                    removed = deduplicate(connection, table, [column.name for column in index.columns])
+                    if removed:
+                        logger.warning(f"{table.name}: удалено повторов ключа {index.name}: {removed}")
+                        if table in {model.__table__ for model in SUITABILITY_SOURCE_MODELS}:
+                            # Пустое хранилище подходимости заполняется заново целиком
+                            connection.execute(SuitabilityScore.__table__.delete())
+                index.create(connection)
+                logger.info(f"Создан индекс {index.name}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -66,6 +66,10 @@ class Theme(Base):
 
 class AdviserTheme(Base):
     __tablename__ = 'adviser_themes'
+    __table_args__ = (
+        Index('uq_adviser_themes_adviser_theme', 'adviser_id', 'theme_id', unique=True),
+        Index('ix_adviser_themes_theme_id', 'theme_id'),
+    )
     adviser_theme_id = Column(Integer, primary_key=True)
     adviser_id = Column(Integer, ForeignKey('advisers.adviser_id'), nullable=False)
     theme_id = Column(Integer, ForeignKey('themes.theme_id'), nullable=False)
@@ -77,6 +81,10 @@ class AdviserTheme(Base):
 
 class ThemeSubjectImportance(Base):
     __tablename__ = 'theme_subject_importances'
+    __table_args__ = (
+        Index('uq_theme_subject_importances_theme_subject', 'theme_id', 'subject_id', unique=True),
+        Index('ix_theme_subject_importances_subject_id', 'subject_id'),
+    )
     theme_subject_importance_id = Column(Integer, primary_key=True)
     theme_id = Column(Integer, ForeignKey('themes.theme_id'), nullable=False)
     subject_id = Column(Integer, ForeignKey('subjects.subject_id'), nullable=False)
@@ -88,6 +96,10 @@ class ThemeSubjectImportance(Base):
 
 class StudentSubjectGrade(Base):
     __tablename__ = 'student_subjects_grades'
+    __table_args__ = (
+        Index('uq_student_subjects_grades_student_subject', 'student_id', 'subject_id', unique=True),
+        Index('ix_student_subjects_grades_subject_id', 'subject_id'),
+    )
     student_subject_grade_id = Column(Integer, primary_key=True)
     student_id = Column(Integer, ForeignKey('students.student_id'), nullable=False)
     subject_id = Column(Integer, ForeignKey('subjects.subject_id'), nullable=False)
@@ -99,6 +111,10 @@ class StudentSubjectGrade(Base):
 
 class StudentThemeInterest(Base):
     __tablename__ = 'student_theme_interests'
+    __table_args__ = (
+        Index('uq_student_theme_interests_student_theme', 'student_id', 'theme_id', unique=True),
+        Index('ix_student_theme_interests_theme_id', 'theme_id'),
+    )
     student_theme_interest_id = Column(Integer, primary_key=True)
     student_id = Column(Integer, ForeignKey('students.student_id'), nullable=False)
     theme_id = Column(Integer, ForeignKey('themes.theme_id'), nullable=False)
@@ -110,6 +126,10 @@ class StudentThemeInterest(Base):
 
 class Distribution(Base):
     __tablename__ = 'distributions'
+    __table_args__ = (
+        Index('ix_distributions_student_id', 'student_id'),
+        Index('ix_distributions_adviser_id', 'adviser_id'),
+    )
 
     distribution_id = Column(Integer, primary_key=True)
     student_id = Column(Integer, ForeignKey('students.student_id'), nullable=False)
@@ -122,6 +142,29 @@ class Distribution(Base):
     adviser = relationship("Adviser", back_populates="distributions")
 
 
+class SuitabilityScore(Base):
+    __tablename__ = 'suitability_scores'
+    __table_args__ = (
+        Index('ix_suitability_scores_theme_id', 'theme_id'),
+    )
+
+    student_id = Column(Integer, ForeignKey('students.student_id'), primary_key=True)
+    theme_id = Column(Integer, ForeignKey('themes.theme_id'), primary_key=True)
+    score = Column(Float, nullable=False)
+
+
+class SuitabilityScoreInvalidation(Base):
+    """
+    Отметка о том, что строку студента или столбец темы в suitability_scores нужно пересчитать.
+    Отметка без student_id и theme_id означает полный пересчет.
+    """
+    __tablename__ = 'suitability_score_invalidations'
+
+    invalidation_id = Column(Integer, primary_key=True)
+    student_id = Column(Integer)
+    theme_id = Column(Integer)
+
+
 class DistributionAlgorithm(Base):
     __tablename__ = 'distribution_algorithms'
 
@@ -136,3 +179,6 @@ class DistributionAlgorithm(Base):
     student_theme_interest = relationship("StudentThemeInterest")
     adviser_theme = relationship("AdviserTheme")
 
+
+# Таблицы, от которых зависят сохраненные степени подходимости
+SUITABILITY_SOURCE_MODELS = (StudentSubjectGrade, ThemeSubjectImportance)
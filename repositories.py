@@ -1,30 +1,172 @@
 
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy import UniqueConstraint, bindparam, event, func, select
+from sqlalchemy.dialects import postgresql, sqlite
 from models import (Student, Adviser, Subject, Theme,
                     ThemeSubjectImportance, StudentSubjectGrade, StudentThemeInterest, Distribution, AdviserTheme,
-                    DistributionAlgorithm)
+                    DistributionAlgorithm, SuitabilityScore, SuitabilityScoreInvalidation,
+                    SUITABILITY_SOURCE_MODELS)
 from faker import Faker
 import random as rnd
 import logging
+import os
+import threading
 from data import *
 from collections import defaultdict, deque
-import heapq
+from itertools import islice
 from werkzeug.security import check_password_hash
+from cache import TTLCache
+from solvers import (SOLVERS, AdviserAvailabilityIndex, AdviserPriorityQueues, AssignmentIndex,
+                     DistributionProblem, PreferenceTable, handle_unassigned_students, process_reprocess_queue,
+                     run_solver)
+from scenarios import format_comparison_table, run_monte_carlo, run_scenarios
+from scoring import (MAX_GRADE, ScoringInputs, SuitabilityMatrix, build_suitability_matrix, iter_student_rankings,
+                     score_interest_cells)
 
 fake = Faker('ru_RU')
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Количество строк в одном executemany при пакетной записи
+BULK_CHUNK_SIZE = 1000
+# Диалекты с INSERT ... ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+# Справочные таблицы, выборки столбцов которых (get_columns) кэшируются. В кэше хранятся только неизменяемые
+# строки: ORM-объекты из него попали бы во все запросы, и изменение атрибута одним было бы видно всем
+CACHED_MODELS = (Theme, Subject, Adviser, AdviserTheme)
+# Строки get_columns справочных таблиц (get_all кэш не использует); тег записи — (engine, модель)
+reference_cache = TTLCache()
+# Размер страницы get_page по умолчанию и наибольший допустимый
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+PAGE_ORDERS = ("asc", "desc")
+
+
+def mark_suitability_dirty(session, student_ids=(), theme_ids=(), full=False):
+    """
+    Отмечает строки студентов и столбцы тем хранилища подходимости для пересчета.
+    Отметки добавляются в переданную сессию и фиксируются вместе с изменением данных.
+    Пока хранилище пусто (режим "store" не используется), отметки не записываются:
+    пустое хранилище при обновлении заполняется целиком.
+    """
+    if session.query(SuitabilityScore.student_id).first() is None:
+        return
+    if full:
+        session.add(SuitabilityScoreInvalidation())
+    for student_id in {student_id for student_id in student_ids if student_id is not None}:
+        session.add(SuitabilityScoreInvalidation(student_id=student_id))
+    for theme_id in {theme_id for theme_id in theme_ids if theme_id is not None}:
+        session.add(SuitabilityScoreInvalidation(theme_id=theme_id))
+
+
+def mark_reference_changed(session, *models):
+    """
+    Отмечает изменение справочных таблиц в сессии.
+    Записи кэша сбрасываются после фиксации транзакции, при откате отметки отбрасываются.
+    """
+    bind = session.get_bind()
+    session.info.setdefault("changed_reference_keys", set()).update(
+        (bind, model) for model in models if model in CACHED_MODELS
+    )
+
+
+def invalidate_changed_references(session):
+    keys = session.info.pop("changed_reference_keys", None)
+    if keys:
+        reference_cache.invalidate(*keys)
+
+
+def discard_reference_marks(session):
+    session.info.pop("changed_reference_keys", None)
+
+
+def iter_chunks(rows, chunk_size):
+    """Разбивает поток строк на списки не длиннее chunk_size."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def has_unique_key(table, key_columns):
+    """Проверяет, что на key_columns таблицы есть первичный ключ, ограничение или индекс уникальности."""
+    wanted = set(key_columns)
+    if {column.name for column in table.primary_key.columns} == wanted:
+        return True
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint) and {column.name for column in constraint.columns} == wanted:
+            return True
+    return any(index.unique and {column.name for column in index.columns} == wanted for index in table.indexes)
+
 
 class BaseRepository:
     def __init__(self, engine):
+        self.engine = engine
         self.Session = sessionmaker(bind=engine)
+        event.listen(self.Session, "after_commit", invalidate_changed_references)
+        event.listen(self.Session, "after_rollback", discard_reference_marks)
 
     def get_all(self, model) -> list:
         """Возвращает все записи модели."""
         with self.Session() as session:
             return session.query(model).all()
 
+    def get_columns(self, model, *columns, **filters):
+        """
+        Возвращает только указанные столбцы записей модели без создания ORM-объектов.
+        Строки поддерживают доступ по имени столбца (row.theme_id) и распаковку как кортеж.
+        Для справочных таблиц (CACHED_MODELS) результат кэшируется.
+
+        :param columns: Имена столбцов или атрибуты модели.
+        :param filters: Условия равенства, как в filter_by.
+        """
+        if not columns:
+            raise ValueError("Не указаны столбцы для выборки")
+        attributes = [getattr(model, column) if isinstance(column, str) else column for column in columns]
+
+        def load():
+            with self.Session() as session:
+                return session.execute(select(*attributes).filter_by(**filters)).all()
+
+        if model in CACHED_MODELS:
+            key = (self.engine, model, tuple(attribute.key for attribute in attributes),
+                   tuple(sorted(filters.items())))
+            return list(reference_cache.get_or_load(key, load, tag=(self.engine, model)))
+        return load()
+
+    def get_page(self, model, after_id=None, limit=DEFAULT_PAGE_SIZE, order="asc", options=(), columns=()):
+        """
+        Возвращает страницу записей модели с переходом по первичному ключу (keyset-пагинация):
+        не больше limit записей, следующих за after_id в порядке order.
+        В отличие от OFFSET, стоимость запроса не растет с номером страницы.
+
+        :param options: Параметры загрузки запроса, например joinedload связанных записей.
+        :param columns: Если указаны, вместо ORM-объектов возвращаются строки с этими столбцами, как в get_columns.
+        :return: (записи, курсор следующей страницы или None для последней страницы).
+        """
+        if order not in PAGE_ORDERS:
+            raise ValueError(f"Неизвестный порядок сортировки: {order}")
+        primary_key = model.__mapper__.primary_key
+        if len(primary_key) != 1:
+            raise ValueError(f"Модель {model.__name__} не имеет простого первичного ключа")
+        key = primary_key[0]
+        with self.Session() as session:
+            if columns:
+                query = session.query(*(getattr(model, column) if isinstance(column, str) else column
+                                        for column in columns), key.label("page_cursor"))
+            else:
+                query = session.query(model).options(*options)
+            if after_id is not None:
+                query = query.filter(key > after_id if order == "asc" else key < after_id)
+            # Лишняя запись показывает, есть ли следующая страница
+            records = query.order_by(key.asc() if order == "asc" else key.desc()).limit(limit + 1).all()
+        if len(records) <= limit:
+            return records, None
+        records = records[:limit]
+        return records, records[-1].page_cursor if columns else getattr(records[-1], key.key)
+
     def get_by_id(self, model, record_id, id_field: str = "id"):
         """Возвращает запись по ID.
         """
@@ -59,16 +201,138 @@ class BaseRepository:
         with self.Session() as session:
             try:
                 session.query(model).delete()
+                if model in SUITABILITY_SOURCE_MODELS:
+                    mark_suitability_dirty(session, full=True)
+                mark_reference_changed(session, model)
                 session.commit()
             except Exception as e:
                 session.rollback()
                 logging.error(f"Ошибка при удалении всех записей модели {model.__name__}: {e}")
 
+    def bulk_insert(self, model, rows, chunk_size=BULK_CHUNK_SIZE, session=None):
+        """
+        Вставляет записи (словари) пакетами через executemany одной транзакцией.
+
+        :param session: Если передана, запись выполняется в ней, а фиксирует транзакцию вызывающий код.
+        :return: Количество вставленных записей.
+        """
+        if session is not None:
+            return self._bulk_write(session, model, rows, chunk_size, self._insert_chunk)
+        with self.Session() as session:
+            try:
+                count = self._bulk_write(session, model, rows, chunk_size, self._insert_chunk)
+                session.commit()
+                return count
+            except Exception as e:
+                session.rollback()
+                logging.error(f"Ошибка при пакетной вставке записей модели {model.__name__}: {e}")
+                raise
+
+    def bulk_upsert(self, model, rows, key_columns, chunk_size=BULK_CHUNK_SIZE, session=None):
+        """
+        Вставляет или обновляет записи (словари) по естественному ключу key_columns одной транзакцией.
+
+        Если на ключе есть ограничение уникальности, а диалект поддерживает INSERT ... ON CONFLICT,
+        используется он; иначе существующие ключи пакета выбираются одним запросом, после чего
+        выполняются executemany UPDATE и INSERT.
+
+        :param session: Если передана, запись выполняется в ней, а фиксирует транзакцию вызывающий код.
+        :return: Количество обработанных записей.
+        """
+        key_columns = tuple(key_columns)
+
+        def write_chunk(write_session, table, chunk):
+            self._upsert_chunk(write_session, table, chunk, key_columns)
+
+        if session is not None:
+            return self._bulk_write(session, model, rows, chunk_size, write_chunk)
+        with self.Session() as session:
+            try:
+                count = self._bulk_write(session, model, rows, chunk_size, write_chunk)
+                session.commit()
+                return count
+            except Exception as e:
+                session.rollback()
+                logging.error(f"Ошибка при пакетном сохранении записей модели {model.__name__}: {e}")
+                raise
+
+    @staticmethod
+    def _bulk_write(session, model, rows, chunk_size, write_chunk):
+        table = model.__table__
+        count = 0
+        student_ids, theme_ids = set(), set()
+        for chunk in iter_chunks(rows, chunk_size):
+            write_chunk(session, table, chunk)
+            count += len(chunk)
+            if model in SUITABILITY_SOURCE_MODELS:
+                student_ids.update(row.get("student_id") for row in chunk)
+                theme_ids.update(row.get("theme_id") for row in chunk)
+        if model in SUITABILITY_SOURCE_MODELS and count:
+            student_ids.discard(None)
+            theme_ids.discard(None)
+            # Большую загрузку проще пересчитать целиком, чем хранить отметку на каждую строку
+            if len(student_ids) + len(theme_ids) > MAX_INCREMENTAL_INVALIDATIONS:
+                mark_suitability_dirty(session, full=True)
+            else:
+                mark_suitability_dirty(session, student_ids=student_ids, theme_ids=theme_ids)
+        if count:
+            mark_reference_changed(session, model)
+        return count
+
+    @staticmethod
+    def _insert_chunk(session, table, chunk):
+        session.execute(table.insert(), chunk)
+
+    @staticmethod
+    def _upsert_chunk(session, table, chunk, key_columns):
+        # Повтор ключа внутри пакета: побеждает последняя строка
+        chunk = list({tuple(row[column] for column in key_columns): row for row in chunk}.values())
+        update_columns = [column for column in chunk[0] if column not in key_columns]
+        dialect_insert = UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+        if dialect_insert is not None and has_unique_key(table, key_columns):
+            statement = dialect_insert(table)
+            if update_columns:
+                statement = statement.on_conflict_do_update(
+                    index_elements=list(key_columns),
+                    set_={column: statement.excluded[column] for column in update_columns}
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=list(key_columns))
+            session.execute(statement, chunk)
+            return
+
+        primary_key = list(table.primary_key.columns)[0]
+        first_key = table.c[key_columns[0]]
+        existing = {
+            tuple(row[1:]): row[0]
+            for row in session.execute(
+                table.select().with_only_columns([primary_key] + [table.c[column] for column in key_columns])
+                .where(first_key.in_({row[key_columns[0]] for row in chunk}))
+            )
+        }
+        updates, inserts = [], []
+        for row in chunk:
+            record_id = existing.get(tuple(row[column] for column in key_columns))
+            if record_id is None:
+                inserts.append(row)
+            elif update_columns:
+                updates.append(dict({f"_{column}": row[column] for column in update_columns},
+                                    _record_id=record_id))
+        if updates:
+            session.execute(
+                table.update().where(primary_key == bindparam("_record_id"))
+                .values({column: bindparam(f"_{column}") for column in update_columns}),
+                updates
+            )
+        if inserts:
+            session.execute(table.insert(), inserts)
+
     def add_record(self, record):
         """Добавляет новую запись."""
         with self.Session() as session:
             try:
                 session.add(record)
+                mark_reference_changed(session, type(record))
                 session.commit()
             except Exception as e:
                 session.rollback()
@@ -83,6 +347,7 @@ class BaseRepository:
                 for key, value in kwargs.items():
                     if hasattr(record, key):
                         setattr(record, key, value)
+                mark_reference_changed(session, type(record))
                 session.commit()
             except Exception as e:
                 session.rollback()
@@ -93,6 +358,7 @@ class BaseRepository:
         with self.Session() as session:
             try:
                 session.delete(record)
+                mark_reference_changed(session, type(record))
                 session.commit()
             except Exception as e:
                 session.rollback()
@@ -125,15 +391,17 @@ class StudentRepository(BaseRepository):
             self.delete_record(student)
 
     def add_initial_students(self,logins:list,passwords:list, count: int = 10):
-        for i in range(count):
-            self.add_student(
-                username=logins[i],
-                password_hash=passwords[i],
-                firstname=fake.first_name_male(),
-                lastname=fake.last_name_male(),
-                patronymic=fake.first_name_male(),
-                group_student=f"A-{fake.random_int(1, 3)}-21"
-            )
+        self.bulk_insert(Student, (
+            {
+                "username": logins[i],
+                "password_hash": passwords[i],
+                "firstname": fake.first_name_male(),
+                "lastname": fake.last_name_male(),
+                "patronymic": fake.first_name_male(),
+                "group_student": f"A-{fake.random_int(1, 3)}-21"
+            }
+            for i in range(count)
+        ))
 
     def display_all_students(self):
         students = self.get_all(Student)
@@ -163,6 +431,7 @@ class AdviserRepository(BaseRepository):
                 password_hash=password_hash
             )
             session.add(new_adviser)
+            mark_reference_changed(session, Adviser)
             session.commit()
 
     def update_adviser(self, adviser_id, firstname=None, lastname=None, patronymic=None, number_of_places=None, username=None, password_hash=None):
@@ -184,6 +453,7 @@ class AdviserRepository(BaseRepository):
                     adviser_record.username = username
                 if password_hash:
                     adviser_record.password_hash = password_hash
+                mark_reference_changed(session, Adviser)
                 session.commit()
 
     def delete_adviser(self, adviser_id):
@@ -194,6 +464,7 @@ class AdviserRepository(BaseRepository):
             adviser_record = self.get_by_id(Adviser, adviser_id, id_field="adviser_id")
             if adviser_record:
                 session.delete(adviser_record)
+                mark_reference_changed(session, Adviser)
                 session.commit()
 
     def add_initial_advisers(self, advisers_data):
@@ -238,6 +509,7 @@ class AdviserRepository(BaseRepository):
         adviser_record = self.get_by_adviser_id(adviser_id, session)
         if adviser_record and adviser_record.number_of_places > 0:
             adviser_record.number_of_places -= 1
+            mark_reference_changed(session, Adviser)
             session.commit()
 
     def increase_adviser_places(self, adviser_id, session):
@@ -247,6 +519,7 @@ class AdviserRepository(BaseRepository):
         adviser_record = self.get_by_adviser_id(adviser_id, session)
         if adviser_record:
             adviser_record.number_of_places += 1
+            mark_reference_changed(session, Adviser)
             session.commit()
 
     def get_by_adviser_id(self, adviser_id, session):
@@ -280,6 +553,7 @@ class AdviserRepository(BaseRepository):
                 password_hash=password_hash
             )
             session.add(new_adviser)
+            mark_reference_changed(session, Adviser)
             session.commit()
 
 
@@ -291,6 +565,7 @@ class SubjectRepository(BaseRepository):
         with self.Session() as session:
             new_subject = Subject(subject_name=subject_name)
             session.add(new_subject)
+            mark_reference_changed(session, Subject)
             session.commit()
 
     def update_subject(self, subject_id, subject_name):
@@ -298,6 +573,7 @@ class SubjectRepository(BaseRepository):
             subject = self.get_by_id(Subject,subject_id, id_field="subject_id")
             if subject:
                 subject.subject_name = subject_name
+                mark_reference_changed(session, Subject)
                 session.commit()
 
     def delete_subject(self, subject_id):
@@ -305,6 +581,7 @@ class SubjectRepository(BaseRepository):
             subject = self.get_by_id(Subject,subject_id, id_field="subject_id")
             if subject:
                 session.delete(subject)
+                mark_reference_changed(session, Subject)
                 session.commit()
 
     def add_initial_subjects(self):
@@ -328,6 +605,7 @@ class ThemeRepository(BaseRepository):
         with self.Session() as session:
             new_theme = Theme(theme_name=theme_name)
             session.add(new_theme)
+            mark_reference_changed(session, Theme)
             session.commit()
 
     def update_theme(self, theme_id, theme_name=None):
@@ -335,6 +613,7 @@ class ThemeRepository(BaseRepository):
             theme_record = self.get_by_id(Theme,theme_id, id_field="theme_id")
             if theme_record:
                 if theme_name: theme_record.theme_name = theme_name
+                mark_reference_changed(session, Theme)
                 session.commit()
 
     def delete_theme(self, theme_id):
@@ -342,6 +621,7 @@ class ThemeRepository(BaseRepository):
             theme_record = self.get_by_id(Theme,theme_id, id_field="theme_id")
             if theme_record:
                 session.delete(theme_record)
+                mark_reference_changed(session, Theme)
                 session.commit()
 
     def add_initial_themes(self):
@@ -357,6 +637,7 @@ class ThemeRepository(BaseRepository):
         with self.Session() as session:
             new_theme = Theme(theme_id=theme_id, theme_name=theme_name)
             session.add(new_theme)
+            mark_reference_changed(session, Theme)
             session.commit()
 
 
@@ -374,6 +655,7 @@ class AdviserThemeRepository(BaseRepository):
             ).first()
             if delete_adviser_theme_priority:
                 session.delete(delete_adviser_theme_priority)
+                mark_reference_changed(session, AdviserTheme)
                 session.commit()
 
     def display_all_adviser_themes(self):
@@ -386,9 +668,10 @@ class AdviserThemeRepository(BaseRepository):
 
     def add_adviser_themes(self, adviser_id, *theme_ids):
         with self.Session() as session:
-            for theme_id in theme_ids:
+            for theme_id in dict.fromkeys(theme_ids):
                 new_adviser_theme = AdviserTheme(adviser_id=adviser_id, theme_id=theme_id)
                 session.add(new_adviser_theme)
+            mark_reference_changed(session, AdviserTheme)
             session.commit()
 
     def update_adviser_themes(self, adviser_id, *new_theme_ids):
@@ -398,10 +681,11 @@ class AdviserThemeRepository(BaseRepository):
             session.query(AdviserTheme).filter(AdviserTheme.adviser_id == adviser_id).delete()
 
             # Добавляем новые темы
-            for theme_id in new_theme_ids:
+            for theme_id in dict.fromkeys(new_theme_ids):
                 new_adviser_theme = AdviserTheme(adviser_id=adviser_id, theme_id=theme_id)
                 session.add(new_adviser_theme)
 
+            mark_reference_changed(session, AdviserTheme)
             session.commit()
 
 
@@ -434,6 +718,7 @@ class ThemeSubjectImportanceRepository(BaseRepository):
                     session.add(new_record)
                     #print(f"Добавлено: Тема ID: {theme_id}, Предмет ID: {subject_id}, Вес: {weight}")
 
+                mark_suitability_dirty(session, theme_ids=[theme_id])
                 session.commit()  # Сохраняем изменения
             except Exception as e:
                 session.rollback()
@@ -441,11 +726,13 @@ class ThemeSubjectImportanceRepository(BaseRepository):
 
     def update_theme_subject_importance(self, theme_subject_importance_id, theme_id=None, subject_id=None, weight=None):
         with self.Session() as session:
-            theme_subject_importance_record = self.get_by_id(ThemeSubjectImportance,theme_subject_importance_id, id_field="theme_subject_importance_id")
+            theme_subject_importance_record = session.query(ThemeSubjectImportance).get(theme_subject_importance_id)
             if theme_subject_importance_record:
+                old_theme_id = theme_subject_importance_record.theme_id
                 if theme_id is not None: theme_subject_importance_record.theme_id = theme_id
                 if subject_id is not None: theme_subject_importance_record.subject_id = subject_id
                 if weight is not None: theme_subject_importance_record.weight = weight
+                mark_suitability_dirty(session, theme_ids=[old_theme_id, theme_subject_importance_record.theme_id])
                 session.commit()
 
     def delete_theme_subject_importance(self, theme_subject_importance_id):
@@ -453,6 +740,7 @@ class ThemeSubjectImportanceRepository(BaseRepository):
             theme_subject_importance_record = self.get_by_id(ThemeSubjectImportance,theme_subject_importance_id, id_field="theme_subject_importance_id")
             if theme_subject_importance_record:
                 session.delete(theme_subject_importance_record)
+                mark_suitability_dirty(session, theme_ids=[theme_subject_importance_record.theme_id])
                 session.commit()
 
     def display_all_theme_subject_importances(self):
@@ -469,6 +757,7 @@ class ThemeSubjectImportanceRepository(BaseRepository):
                     # Удаляем существующие записи для данной темы
                     delete_session.query(ThemeSubjectImportance).filter(
                         ThemeSubjectImportance.theme_id == theme.theme_id).delete()
+                    mark_suitability_dirty(delete_session, theme_ids=[theme.theme_id])
                     delete_session.commit()  # Коммитим изменения
                 except Exception as e:
                     delete_session.rollback()
@@ -490,8 +779,10 @@ class ThemeSubjectImportanceRepository(BaseRepository):
                     # Проверка на сумму весов
                     assert abs(sum(normalized_weights) - 1.0) < 1e-6, "Сумма нормализованных весов не равна 1"
 
-                    for subject, normalized_weight in zip(selected_subjects, normalized_weights):
-                        self.add_theme_subject_importance(theme.theme_id, subject.subject_id, normalized_weight)
+                    self.bulk_upsert(ThemeSubjectImportance, (
+                        {"theme_id": theme.theme_id, "subject_id": subject.subject_id, "weight": normalized_weight}
+                        for subject, normalized_weight in zip(selected_subjects, normalized_weights)
+                    ), key_columns=("theme_id", "subject_id"), session=add_session)
 
                     add_session.commit()
                 except Exception as e:
@@ -509,15 +800,18 @@ class StudentSubjectGradeRepository(BaseRepository):
         with self.Session() as session:
             new_student_subject_grade = StudentSubjectGrade(student_id=student_id, subject_id=subject_id, grade=grade)
             session.add(new_student_subject_grade)
+            mark_suitability_dirty(session, student_ids=[student_id])
             session.commit()
 
     def update_student_subject_grade(self, student_subject_grade_id, student_id=None, subject_id=None, grade=None):
         with self.Session() as session:
-            student_subject_grade_record = self.get_by_id(StudentSubjectGrade,student_subject_grade_id, id_field="student_subject_grade_id")
+            student_subject_grade_record = session.query(StudentSubjectGrade).get(student_subject_grade_id)
             if student_subject_grade_record:
+                old_student_id = student_subject_grade_record.student_id
                 if student_id is not None: student_subject_grade_record.student_id = student_id
                 if subject_id is not None: student_subject_grade_record.subject_id = subject_id
                 if grade is not None: student_subject_grade_record.grade = grade
+                mark_suitability_dirty(session, student_ids=[old_student_id, student_subject_grade_record.student_id])
                 session.commit()
 
     def delete_student_subject_grade(self, student_subject_grade_id):
@@ -525,6 +819,7 @@ class StudentSubjectGradeRepository(BaseRepository):
             student_subject_grade_record = self.get_by_id(StudentSubjectGrade,student_subject_grade_id, id_field="student_subject_grade_id")
             if student_subject_grade_record:
                 session.delete(student_subject_grade_record)
+                mark_suitability_dirty(session, student_ids=[student_subject_grade_record.student_id])
                 session.commit()
 
     def display_all_student_subject_grades(self):
@@ -548,10 +843,9 @@ class StudentThemeInterestRepository(BaseRepository):
             session.commit()
 
     def update_student_theme_interest(self, student_id, theme_id, interest_level):
-        with self.Session() as session:
-            student_theme_interest = StudentThemeInterest(student_id=student_id, theme_id=theme_id, interest_level=interest_level)
-            session.add(student_theme_interest)
-            session.commit()
+        self.bulk_upsert(StudentThemeInterest,
+                         [{"student_id": student_id, "theme_id": theme_id, "interest_level": interest_level}],
+                         key_columns=("student_id", "theme_id"))
 
     def generate_random_interests(self):
         with self.Session() as session:
@@ -564,9 +858,11 @@ class StudentThemeInterestRepository(BaseRepository):
 
     def initialize_student_interests(self):
         students = self.student_repository.get_all(Student)
-        for student in students:
-            interests = self.generate_random_interests()
-            self.add_multiple_student_theme_interests(student.student_id, interests)
+        self.bulk_insert(StudentThemeInterest, (
+            {"student_id": student.student_id, "theme_id": theme_id, "interest_level": interest_level}
+            for student in students
+            for theme_id, interest_level in self.generate_random_interests()
+        ))
 
     def add_multiple_student_theme_interests(self, student_id, interests):
         with self.Session() as session:
@@ -590,16 +886,37 @@ class StudentThemeInterestRepository(BaseRepository):
                 StudentThemeInterest.student_id == student_id).all()
 
 
+SCORING_MODES = ("matrix", "sql", "store")
+# При большем числе отметок хранилище подходимости пересчитывается целиком
+MAX_INCREMENTAL_INVALIDATIONS = 500
+# Распределение читается и перезаписывается целиком (места руководителей — абсолютными значениями),
+# поэтому полные запуски и обновления для отдельных студентов в одном процессе выполняются по одному
+_distribution_lock = threading.Lock()
+
+
 class DistributionAlgorithmRepository(BaseRepository):
     def __init__(self, engine, student_subject_grade_repository, student_theme_interest_repository,
-                 theme_subject_importance_repository, adviser_theme_repository, distribution_repository):
+                 theme_subject_importance_repository, adviser_theme_repository, distribution_repository,
+                 scoring_mode="matrix", scoring_workers=1):
+        """
+        :param scoring_mode: Способ расчета подходимости: "matrix" — матричное произведение в NumPy,
+                             "sql" — агрегирующий запрос на стороне базы данных,
+                             "store" — сохраненные оценки с пересчетом только измененных строк и столбцов.
+        :param scoring_workers: Количество процессов для расчета в режиме "matrix";
+                                None — по числу ядер процессора.
+        """
         super().__init__(engine)
+        if scoring_mode not in SCORING_MODES:
+            raise ValueError(f"Неизвестный режим расчета подходимости: {scoring_mode}")
+        self.scoring_mode = scoring_mode
+        self.scoring_workers = scoring_workers if scoring_workers is not None else os.cpu_count()
         self.distribution_repository = distribution_repository
         self.student_grade_record_repository = student_subject_grade_repository
         self.student_theme_interest_repository = student_theme_interest_repository
         self.theme_subject_importance_repository = theme_subject_importance_repository
         self.adviser_theme_repository = adviser_theme_repository
         self.advisers = {}
+        self.last_run_report = None
 
     def create_distribution_algorithm(self):
         with self.Session() as session:
@@ -608,447 +925,419 @@ class DistributionAlgorithmRepository(BaseRepository):
             session.commit()
             return new_algorithm.distribution_algorithm_id
 
-    def link_theme_subject_importance_with_student_subject_grade(self):
-        suitability_scores = {}
-        with self.student_grade_record_repository.Session() as session:
-            theme_subject_importance_records = session.query(ThemeSubjectImportance).all()
-            student_subject_grade_records = session.query(StudentSubjectGrade).all()
-
-            subject_weights = {}
-            for importance in theme_subject_importance_records:
-                theme_id = importance.theme_id
-                subject_id = importance.subject_id
-                weight = importance.weight
-
-                if theme_id not in subject_weights:
-                    subject_weights[theme_id] = {}
-                subject_weights[theme_id][subject_id] = weight
-
-            for theme_id, subjects in subject_weights.items():
-                for subject_id, weight in subjects.items():
-                    for grade_record in student_subject_grade_records:
-                        if grade_record.subject_id == subject_id:
-                            student_id = grade_record.student_id
-                            grade = grade_record.grade
-
-                            weighted_grade = grade * weight
-
-                            if (theme_id, student_id) not in suitability_scores:
-                                suitability_scores[(theme_id, student_id)] = 0
-
-                            suitability_scores[(theme_id, student_id)] += weighted_grade
-
-            # Логирование суммарных взвешенных оценок
-            # print("\nСуммарные взвешенные оценки:")
-            # for key, score in suitability_scores.items():
-            #     print(f"Тема ID: {key[0]}, Студент ID: {key[1]}, Взвешенная оценка: {round(score, 2)}")
+    def compute_suitability_matrix(self, mode=None):
+        """
+        Вычисляет матрицу подходимости студентов к темам (студенты × темы).
 
-            for key in suitability_scores:
-                max_possible_score = sum(weight * 5 for weight in subject_weights[key[0]].values())
-                normalized_score = (suitability_scores[key] / max_possible_score) * 100 if max_possible_score > 0 else 0
-                suitability_scores[key] = round(normalized_score, 2)
+        :param mode: Режим расчета; по умолчанию используется scoring_mode репозитория.
+        """
+        mode = mode or self.scoring_mode
+        if mode == "sql":
+            return self.compute_suitability_matrix_sql()
+        if mode == "store":
+            return self.load_suitability_matrix_from_store()
 
-            # # Логирование нормализованных оценок
-            # print("\nНормализованные оценки соответствия:")
-            # for key, score in suitability_scores.items():
-            #     print(f"Тема ID: {key[0]}, Студент ID: {key[1]}, Степень подходимости студента к теме: {score:.2f}%")
+        with self.student_grade_record_repository.Session() as session:
+            grade_rows, importance_rows = self.load_scoring_rows(session)
+        return build_suitability_matrix(ScoringInputs.from_rows(grade_rows, importance_rows))
 
-        return suitability_scores
+    def load_scoring_inputs(self, student_ids=None):
+        """
+        Загружает оценки, веса и интересы в разреженные массивы (ScoringInputs).
+        Вызывается один раз за запуск распределения.
 
-    def link_weighted_grades_with_interest(self):
-        student_scores = {}  # Словарь для хранения данных о студентах
+        :param student_ids: Загрузить данные только этих студентов (веса тем загружаются полностью).
+        """
+        with self.student_grade_record_repository.Session() as session:
+            grade_rows, importance_rows = self.load_scoring_rows(session, student_ids=student_ids)
         with self.student_theme_interest_repository.Session() as session:
-            suitability_scores = self.link_theme_subject_importance_with_student_subject_grade()
-            student_theme_interests = session.query(StudentThemeInterest).all()
-
-            # Сбор всех интересов студентов
-            for (theme_id, student_id), suitability_score in suitability_scores.items():
-                interest_level = next((interest.interest_level for interest in student_theme_interests
-                                       if interest.student_id == student_id and interest.theme_id == theme_id), None)
-                if interest_level is not None:
-                    # Сохраняем в словаре кортеж (степень подходимости, уровень интереса)
-                    student_scores[student_id] = student_scores.get(student_id, [])
-                    student_scores[student_id].append((theme_id, suitability_score, interest_level))
-
-            sorted_results = []
-            for student_id, scores in student_scores.items():
-                sorted_scores = sorted(scores, key=lambda x: ( x[2]))
-                sorted_results.extend([(student_id, theme_id, suitability_score, interest_level) for
-                                       theme_id, suitability_score, interest_level in sorted_scores])
-
-            print("\nРезультаты соответствия тем и интересов студентов:")
-            for student_id, theme_id, suitability_score, interest_level in sorted_results:
-                print(f"Студент ID: {student_id}, Тема ID: {theme_id}, "
-                      f"Степень подходимости: {round(suitability_score, 2)}%, "
-                      f"Уровень интереса: {interest_level}")
-
-        return sorted_results  # Возвращаем отсортированные результаты
-
-    def prepare_advisers_and_themes(self):
+            interest_query = session.query(StudentThemeInterest.student_id, StudentThemeInterest.theme_id,
+                                           StudentThemeInterest.interest_level)
+            if student_ids is not None:
+                interest_query = interest_query.filter(StudentThemeInterest.student_id.in_(student_ids))
+            interest_rows = interest_query.all()
+        inputs = ScoringInputs.from_rows(grade_rows, importance_rows, interest_rows)
+        logger.debug(f"Загружены данные для расчета подходимости: {inputs.grades.nnz} оценок, "
+                     f"{inputs.weights.nnz} весов, {inputs.interests.nnz} интересов, {inputs.nbytes} байт")
+        return inputs
+
+    @staticmethod
+    def load_scoring_rows(session, student_ids=None, theme_ids=None):
+        """
+        Загружает оценки и веса кортежами, без создания ORM-объектов.
+        Фильтры по студентам и темам используются при частичном пересчете.
+        """
+        grade_query = session.query(StudentSubjectGrade.student_id, StudentSubjectGrade.subject_id,
+                                     StudentSubjectGrade.grade)
+        importance_query = session.query(ThemeSubjectImportance.theme_id, ThemeSubjectImportance.subject_id,
+                                         ThemeSubjectImportance.weight)
+        if student_ids is not None:
+            grade_query = grade_query.filter(StudentSubjectGrade.student_id.in_(student_ids))
+        if theme_ids is not None:
+            importance_query = importance_query.filter(ThemeSubjectImportance.theme_id.in_(theme_ids))
+        return grade_query.all(), importance_query.all()
+
+    def compute_suitability_matrix_sql(self):
+        """
+        Вычисляет взвешенные оценки одним агрегирующим запросом: оценки соединяются с весами
+        по subject_id, группируются по (тема, студент) и делятся на максимально возможную оценку темы.
+        """
+        with self.student_grade_record_repository.Session() as session:
+            max_scores = session.query(
+                ThemeSubjectImportance.theme_id.label("theme_id"),
+                (func.sum(ThemeSubjectImportance.weight) * MAX_GRADE).label("max_possible_score")
+            ).group_by(ThemeSubjectImportance.theme_id).subquery()
+
+            weighted_grade = func.sum(StudentSubjectGrade.grade * ThemeSubjectImportance.weight)
+            normalized_score = func.coalesce(weighted_grade / func.nullif(max_scores.c.max_possible_score, 0), 0) * 100
+
+            score_rows = session.query(
+                ThemeSubjectImportance.theme_id, StudentSubjectGrade.student_id, normalized_score
+            ).select_from(StudentSubjectGrade).join(
+                ThemeSubjectImportance, ThemeSubjectImportance.subject_id == StudentSubjectGrade.subject_id
+            ).join(
+                max_scores, max_scores.c.theme_id == ThemeSubjectImportance.theme_id
+            ).group_by(
+                ThemeSubjectImportance.theme_id, StudentSubjectGrade.student_id, max_scores.c.max_possible_score
+            ).all()
+        return SuitabilityMatrix.from_scores(score_rows)
+
+    def refresh_suitability_store(self):
         """
-        Подготавливает данные о научных руководителях и их темах.
+        Пересчитывает в suitability_scores только строки студентов и столбцы тем, отмеченные
+        при изменении оценок и весов. Пустое хранилище заполняется целиком.
+        :return: Количество записанных оценок.
         """
         with self.Session() as session:
-            advisers = {adv.adviser_id: adv for adv in session.query(Adviser).all()}
-            adviser_themes = defaultdict(list)
-            for adv_theme in session.query(AdviserTheme).all():
-                adviser_themes[adv_theme.adviser_id].append(adv_theme.theme_id)
-            return advisers, adviser_themes
+            try:
+                invalidations = session.query(SuitabilityScoreInvalidation.invalidation_id,
+                                              SuitabilityScoreInvalidation.student_id,
+                                              SuitabilityScoreInvalidation.theme_id).all()
+                is_empty = session.query(SuitabilityScore.student_id).first() is None
+                if not invalidations and not is_empty:
+                    return 0
+
+                student_ids = {student_id for _, student_id, _ in invalidations if student_id is not None}
+                theme_ids = {theme_id for _, _, theme_id in invalidations if theme_id is not None}
+                full_refresh = (is_empty
+                                or any(student_id is None and theme_id is None
+                                       for _, student_id, theme_id in invalidations)
+                                or len(student_ids) + len(theme_ids) > MAX_INCREMENTAL_INVALIDATIONS)
+
+                score_rows = {}
+                if full_refresh:
+                    session.query(SuitabilityScore).delete(synchronize_session=False)
+                    rows = self.load_scoring_rows(session)
+                    score_rows.update(build_suitability_matrix(ScoringInputs.from_rows(*rows)).to_score_rows())
+                else:
+                    session.query(SuitabilityScore).filter(
+                        SuitabilityScore.student_id.in_(student_ids) | SuitabilityScore.theme_id.in_(theme_ids)
+                    ).delete(synchronize_session=False)
+                    if student_ids:
+                        rows = self.load_scoring_rows(session, student_ids=student_ids)
+                        score_rows.update(build_suitability_matrix(ScoringInputs.from_rows(*rows)).to_score_rows())
+                    if theme_ids:
+                        rows = self.load_scoring_rows(session, theme_ids=theme_ids)
+                        score_rows.update(build_suitability_matrix(ScoringInputs.from_rows(*rows)).to_score_rows())
+
+                if score_rows:
+                    session.execute(SuitabilityScore.__table__.insert(), [
+                        {"student_id": student_id, "theme_id": theme_id, "score": score}
+                        for (theme_id, student_id), score in score_rows.items()
+                    ])
+                # Удаляем только обработанные отметки: новые могли появиться во время пересчета
+                last_invalidation_id = max((row[0] for row in invalidations), default=None)
+                if last_invalidation_id is not None:
+                    session.query(SuitabilityScoreInvalidation).filter(
+                        SuitabilityScoreInvalidation.invalidation_id <= last_invalidation_id
+                    ).delete(synchronize_session=False)
+                session.commit()
+                logger.debug(f"Хранилище подходимости обновлено: {len(score_rows)} оценок, "
+                             f"полный пересчет: {full_refresh}")
+                return len(score_rows)
+            except Exception as e:
+                session.rollback()
+                logging.error(f"Ошибка при обновлении хранилища подходимости: {e}")
+                raise
 
-    def create_priority_queues(self, sorted_results):
+    def load_suitability_matrix_from_store(self):
         """
-        Создает очереди приоритетов для тем на основе результатов соответствия.
+        Возвращает матрицу подходимости из suitability_scores, предварительно пересчитав измененные ячейки.
         """
-        theme_priority_queues = defaultdict(list)
-        student_entries = defaultdict(list)
-
-        for student_id, theme_id, suitability, interest in sorted_results:
-            heapq.heappush(theme_priority_queues[theme_id], (-suitability, student_id))
-            student_entries[student_id].append((suitability, theme_id, interest))
-
-        return theme_priority_queues, student_entries
+        self.refresh_suitability_store()
+        with self.Session() as session:
+            score_rows = session.query(SuitabilityScore.theme_id, SuitabilityScore.student_id,
+                                       SuitabilityScore.score).all()
+        return SuitabilityMatrix.from_scores(score_rows)
 
-    def assign_students(self, student_entries, advisers, adviser_themes, theme_priority_queues, adviser_assignments,
-                        session=None):
+    def link_theme_subject_importance_with_student_subject_grade(self, mode=None):
         """
-        Основной цикл для распределения студентов по научным руководителям и темам.
+        Возвращает степени подходимости в формате {(theme_id, student_id): процент}.
         """
-        if session is None:
-            raise ValueError("Session должна быть передана для обновления данных в базе.")
+        return self.compute_suitability_matrix(mode).to_dict()
 
-        assigned_students = set()
-        distributions = []
-        reprocess_queue = deque()
-
-        for student_id in student_entries:
-            if student_id in assigned_students:
-                continue
-            for interest_level in range(1, 6):
-                themes = [
-                    (suit, theme, int_level)
-                    for suit, theme, int_level in student_entries[student_id]
-                    if int_level == interest_level
-                ]
-                if not themes:
-                    continue
-                best_theme = max(themes, key=lambda x: x[0])[1]
-                if self.assign_with_replacement(
-                        student_id,
-                        best_theme,
-                        themes[0][0],
-                        advisers,
-                        adviser_themes,
-                        theme_priority_queues,
-                        adviser_assignments,
-                        assigned_students,
-                        distributions,
-                        reprocess_queue,
-                        session=session  # Передаем session
-                ):
-                    break
-        return assigned_students, distributions, reprocess_queue
-
-    def process_reprocess_queue(self, reprocess_queue, student_entries, advisers, adviser_themes,
-                                theme_priority_queues, assigned_students, distributions, adviser_assignments,
-                                session=None):
-        if session is None:
-            raise ValueError("Session должна быть передана для обновления данных в базе.")
-
-        while reprocess_queue:
-            student_id = reprocess_queue.popleft()
-            if student_id in assigned_students:
-                continue
-
-            for interest_level in range(1, 6):
-                themes = [
-                    (suit, theme, int_level)
-                    for suit, theme, int_level in student_entries[student_id]
-                    if int_level == interest_level
-                ]
-                if not themes:
-                    continue
-
-                best_theme = max(themes, key=lambda x: x[0])[1]
-                if self.assign_with_replacement(
-                        student_id,
-                        best_theme,
-                        themes[0][0],
-                        advisers,
-                        adviser_themes,
-                        theme_priority_queues,
-                        adviser_assignments,
-                        assigned_students,
-                        distributions,
-                        session=session
-                ):
-                    break
-
-    def assign_with_replacement(self, student_id, theme_id, suitability, advisers, adviser_themes,
-                                theme_priority_queues, adviser_assignments, assigned_students, distributions,
-                                reprocess_queue=None, session=None):
-        if reprocess_queue is None:
-            reprocess_queue = deque()
-        if session is None:
-            raise ValueError("Session должна быть передана для обновления данных в базе.")
-
-        available_advisers = [
-            adv_id for adv_id in adviser_themes
-            if theme_id in adviser_themes[adv_id] and advisers[adv_id].number_of_places > 0
-        ]
-
-        if available_advisers:
-            adv_id = available_advisers[0]
-            adviser_assignments[adv_id].append(student_id)
-            heapq.heappush(theme_priority_queues[theme_id], (-suitability, student_id))
-            distributions.append({
-                "theme_id": theme_id,
-                "student_id": student_id,
-                "adviser_id": adv_id
-            })
-            assigned_students.add(student_id)
-
-            # Уменьшаем число мест у научного руководителя
-            adviser = advisers[adv_id]
-            adviser.number_of_places -= 1
-            session.commit()
-
-            return True
-        else:
-            if theme_priority_queues[theme_id]:
-                lowest_suit, existing_student = heapq.heappop(theme_priority_queues[theme_id])
-                lowest_suit = -lowest_suit
-                if suitability > lowest_suit:
-                    replaced_adv_id = None
-                    for adv_id in adviser_assignments:
-                        if existing_student in adviser_assignments[adv_id]:
-                            adviser_assignments[adv_id].remove(existing_student)
-                            replaced_adv_id = adv_id
-                            break
-
-                    if replaced_adv_id is not None:
-                        # Восстанавливаем место для старого научного руководителя
-                        replaced_adviser = advisers[replaced_adv_id]
-                        replaced_adviser.number_of_places += 1
-                        session.commit()
-
-                    # Назначаем нового студента
-                    adv_id = next(
-                        adv_id for adv_id in adviser_assignments
-                        if existing_student in adviser_assignments[adv_id]
-                    )
-                    adviser_assignments[adv_id].append(student_id)
-                    heapq.heappush(theme_priority_queues[theme_id], (-suitability, student_id))
-                    distributions.append({
-                        "theme_id": theme_id,
-                        "student_id": student_id,
-                        "adviser_id": adv_id
-                    })
-                    assigned_students.add(student_id)
-
-                    # Уменьшаем число мест у нового научного руководителя
-                    adviser = advisers[adv_id]
-                    adviser.number_of_places -= 1
-                    session.commit()
-
-                    if existing_student not in assigned_students:
-                        reprocess_queue.append(existing_student)
-                    return True
-                else:
-                    heapq.heappush(theme_priority_queues[theme_id], (-lowest_suit, existing_student))
-        return False
-
-    def handle_unassigned_students(self, unassigned_students, student_entries, advisers, adviser_themes,
-                                   adviser_assignments, distributions, session):
+    def score_interest_cells(self, inputs):
         """
-        Обрабатывает студентов, которые остались нераспределенными.
-        Возвращает список студентов, которые так и не были назначены.
+        Возвращает подходимость для ячеек интересов (выровненную с inputs.interests.data)
+        и булев массив ячеек, для которых оценка существует.
+        В режиме "matrix" считаются только нужные ячейки, остальные режимы берут их из полной матрицы.
         """
-        remain_students = set()  # Список для хранения оставшихся студентов
-
-        for student_id in unassigned_students:
-            logging.debug(f"Обработка нераспределенного Студента ID: {student_id}")
+        if self.scoring_mode == "matrix":
+            return score_interest_cells(inputs, workers=self.scoring_workers)
+        matrix = self.compute_suitability_matrix()
+        return matrix.gather(inputs.student_ids[inputs.interests.row_indices()],
+                             inputs.theme_ids[inputs.interests.indices])
 
-            available_themes = [theme_id for suit, theme_id, int_level in student_entries[student_id]]
-            logging.debug(f"Доступные темы для Студента ID: {student_id}: {available_themes}")
+    def iter_student_preferences(self, inputs=None):
+        """
+        Лениво выдает (student_id, [(theme_id, степень подходимости, уровень интереса), ...])
+        по одному студенту, без промежуточного плоского списка.
+        """
+        if inputs is None:
+            inputs = self.load_scoring_inputs()
+        scores, valid = self.score_interest_cells(inputs)
+        return iter_student_rankings(inputs, scores, valid)
 
-            available_advisers = [
-                adv_id for adv_id in adviser_themes
-                if set(adviser_themes[adv_id]) & set(available_themes) and len(adviser_assignments[adv_id]) < advisers[
-                    adv_id].number_of_places
-            ]
-            logging.debug(
-                f"Доступные научные руководители для Студента ID: {student_id}: {available_advisers}")
+    def rank_student_themes(self, inputs=None):
+        """
+        Возвращает для каждого студента список (theme_id, степень подходимости, уровень интереса),
+        упорядоченный по уровню интереса.
+        """
+        return dict(self.iter_student_preferences(inputs))
 
-            if not available_advisers:
-                logging.debug(f"Нет доступных научных руководителей для Студента ID: {student_id}")
-                remain_students.add(student_id)
-                continue
+    def load_adviser_capacities(self, include_assigned=False):
+        """
+        Загружает места и темы руководителей кортежами, без ORM-объектов.
+        :param include_assigned: Прибавить места, занятые сохраненными распределениями: number_of_places
+                                 хранит остаток после последнего сохранения, а не полную вместимость.
+        :return: (capacities, adviser_themes).
+        """
+        with self.Session() as session:
+            capacities = {adviser_id: number_of_places for adviser_id, number_of_places
+                          in session.query(Adviser.adviser_id, Adviser.number_of_places).all()}
+            if include_assigned:
+                for adviser_id, assigned in session.query(Distribution.adviser_id, func.count()) \
+                        .group_by(Distribution.adviser_id).all():
+                    if adviser_id in capacities:
+                        capacities[adviser_id] += assigned
+            adviser_themes = defaultdict(list)
+            for adviser_id, theme_id in session.query(AdviserTheme.adviser_id, AdviserTheme.theme_id).all():
+                adviser_themes[adviser_id].append(theme_id)
+        return capacities, adviser_themes
 
-            best_adv = max(
-                available_advisers,
-                key=lambda x: (advisers[x].number_of_places - len(adviser_assignments[x]), x)
-            )
-            common_theme = next(theme for theme in adviser_themes[best_adv] if theme in available_themes)
-            logging.debug(
-                f"Студент ID: {student_id} назначен на Тему ID: {common_theme}, Научный руководитель ID: {best_adv}")
-
-            # Назначаем студента
-            adviser_assignments[best_adv].append(student_id)
-            distributions.append({
-                "student_id": student_id,
-                "theme_id": common_theme,
-                "adviser_id": best_adv
-            })
-
-        return remain_students  # Возвращаем список оставшихся студентов
-
-    def assign_students_to_advisers_and_distribute(self):
-        sorted_results = self.link_weighted_grades_with_interest()
+    def load_distribution_problem(self, preferences=None):
+        """
+        Загружает входные данные распределения в память (DistributionProblem).
+        Предпочтения складываются из потока прямо в PreferenceTable, без промежуточного словаря.
+        Места руководителей — полная вместимость, как будто сохраненных распределений нет.
+        """
+        if preferences is None:
+            preferences = PreferenceTable.from_preferences(self.iter_student_preferences())
+        capacities, adviser_themes = self.load_adviser_capacities(include_assigned=True)
         with self.Session() as session:
-            advisers, adviser_themes = self.prepare_advisers_and_themes()
-            theme_priority_queues, student_entries = self.create_priority_queues(sorted_results)
-            adviser_assignments = defaultdict(list)
+            student_ids = [student_id for student_id, in session.query(Student.student_id).all()]
+        return DistributionProblem(preferences, capacities, adviser_themes, student_ids)
 
-            # Распределение студентов
-            assigned_students, distributions, reprocess_queue = self.assign_students(
-                student_entries, advisers, adviser_themes, theme_priority_queues, adviser_assignments, session
-            )
+    def load_student_preferences(self, student_ids):
+        """
+        Считает предпочтения только для указанных студентов.
+        :return: поток (student_id, [(theme_id, степень подходимости, уровень интереса), ...]).
+        """
+        inputs = self.load_scoring_inputs(student_ids=list(student_ids))
+        return self.iter_student_preferences(inputs)
 
-            # Обработка очереди повторной обработки
-            self.process_reprocess_queue(
-                reprocess_queue, student_entries, advisers, adviser_themes, theme_priority_queues, assigned_students,
-                distributions, adviser_assignments, session
-            )
+    def assign_students_to_advisers_and_distribute(self, solver="greedy", trace_memory=False,
+                                                   improve_time_budget=None):
+        """
+        Распределяет студентов по научным руководителям и темам алгоритмом из реестра SOLVERS.
+        Алгоритм работает в памяти; распределения и оставшиеся места записываются в базу
+        одной транзакцией в конце. Показатели запуска сохраняются в last_run_report.
+
+        :param solver: "greedy" — жадное распределение с заменой, "min_cost_flow" — оптимальное
+                       распределение через поток минимальной стоимости, "deferred_acceptance" —
+                       устойчивое распределение отложенным принятием, либо имя, зарегистрированное
+                       через register_solver.
+        :param trace_memory: Измерять пик памяти через tracemalloc (замедляет алгоритм).
+        :param improve_time_budget: Время в секундах на улучшение результата локальным поиском;
+                                    None — без улучшения.
+        """
+        if solver not in SOLVERS:
+            raise ValueError(f"Неизвестный алгоритм распределения: {solver}")
 
-            all_students = {s.student_id for s in self.get_all(Student)}
-            unassigned_students = all_students - assigned_students
+        with _distribution_lock:
+            problem = self.load_distribution_problem()
+            result, self.last_run_report = run_solver(solver, problem, trace_memory=trace_memory,
+                                                      improve_time_budget=improve_time_budget)
+            logging.info(f"Показатели распределения: {self.last_run_report.as_dict()}")
 
-            # Обработка нераспределенных студентов
-            remain_students = self.handle_unassigned_students(unassigned_students, student_entries, advisers, adviser_themes,
-                                            adviser_assignments, distributions, session)
+            # Заменяем прежние распределения новыми и сохраняем количество мест одной транзакцией
+            self.save_distribution_result(result.distributions, result.remaining_places, replace_all=True)
 
+        # Логирование финального состояния
+        logging.debug("Финальное состояние научных руководителей:")
+        for adv_id, places in result.remaining_places.items():
+            logging.debug(f"ID Руководителя: {adv_id}, Мест: {places}")
 
+        return result.unassigned_students
 
-            # self.handle_overbooked_students(remain_students, student_entries, advisers, adviser_themes,
-            #                                 adviser_assignments, distributions, session)
+    def repair_distribution_for_student(self, student_id):
+        """
+        Обновляет сохраненное распределение после изменения приоритетов одного студента без полного пересчета.
 
-            # Сохраняем распределения
-            self.distribution_repository.add_distribution(distributions)
+        Место студента освобождается, и он заново проходит через assign_with_replacement; цепочка вытеснений
+        обрабатывается только пока она распространяется. Подходимость считается лишь для студентов,
+        которых затронула цепочка, и для студентов руководителей, чьи места оспариваются.
+        Изменения записываются одной транзакцией.
 
-            # Синхронизируем количество мест у научных руководителей в базе данных
-            self.finalize_adviser_places(advisers, session=session)
+        :return: Новые записи распределения студентов, чье назначение изменилось.
+        """
+        with _distribution_lock:
+            return self._repair_distribution_for_student(student_id)
 
-            # Логирование финального состояния
-            logging.debug("Финальное состояние научных руководителей:")
-            for adv_id, adviser in advisers.items():
-                logging.debug(f"ID Руководителя: {adv_id}, Мест: {adviser.number_of_places}")
+    def _repair_distribution_for_student(self, student_id):
+        with self.Session() as session:
+            rows = session.query(Distribution.student_id, Distribution.theme_id, Distribution.adviser_id).all()
+        if not rows:
+            logging.info("Распределение еще не выполнялось, обновлять нечего")
+            return []
+
+        capacities, adviser_themes = self.load_adviser_capacities()
+        original = {distributed_student: (adviser_id, theme_id) for distributed_student, theme_id, adviser_id in rows}
+        assignments = AssignmentIndex()
+        for distributed_student, (adviser_id, theme_id) in original.items():
+            assignments.assign(distributed_student, adviser_id, theme_id, None)
+        availability = AdviserAvailabilityIndex(adviser_themes, capacities)
+        preference_table = PreferenceTable(loader=self.load_student_preferences)
+
+        def load_adviser_students(adviser_id):
+            holders = list(assignments.students_of(adviser_id))
+            preference_table.preload(holders)
+            queue_entries = []
+            for holder in holders:
+                theme_id = assignments.get(holder)[1]
+                queue_entries.append((holder, theme_id, preference_table.suitability(holder, theme_id, 0.0)))
+            return queue_entries
+
+        adviser_queues = AdviserPriorityQueues(loader=load_adviser_students)
+
+        # Освобождаем место студента и назначаем его заново
+        if student_id in assignments:
+            released_adv_id, _, _ = assignments.evict(student_id)
+            availability.release(released_adv_id)
+        process_reprocess_queue(deque([student_id]), preference_table, availability, adviser_queues, assignments)
+        lost_students = ({student_id} | set(original)) - set(assignments.by_student)
+        handle_unassigned_students(lost_students, preference_table, availability, assignments)
+
+        changed = [
+            distribution for distribution in assignments.distributions()
+            if original.get(distribution["student_id"]) != (distribution["adviser_id"], distribution["theme_id"])
+        ]
+        replaced_student_ids = {distribution["student_id"] for distribution in changed} | (
+            lost_students & set(original))
+        places = {adv_id: availability.free[adv_id] for adv_id in capacities
+                  if availability.free[adv_id] != capacities[adv_id]}
+        self.save_distribution_result(changed, places, replaced_student_ids=replaced_student_ids)
+        logging.info(f"Распределение обновлено для Студента ID: {student_id}, изменено назначений: {len(changed)}")
+        return changed
+
+    def run_scenarios(self, scenarios, workers=None):
+        """
+        Загружает входные данные один раз и выполняет сценарии «что если» (scenarios.Scenario)
+        параллельно, без записи в базу.
 
-            return unassigned_students
+        :param workers: Количество процессов; None — по числу ядер, 1 — последовательно.
+        :return: Список ScenarioOutcome в порядке сценариев.
+        """
+        problem = self.load_distribution_problem()
+        outcomes = run_scenarios(problem, scenarios, workers=workers)
+        logging.info(f"Сравнение сценариев:\n{format_comparison_table(outcomes)}")
+        return outcomes
 
-    def finalize_adviser_places(self, advisers, session=None):
+    def run_monte_carlo(self, runs=100, solver="greedy", seed=0, workers=None):
         """
-        Синхронизирует количество мест у научных руководителей в базе данных.
+        Проверяет устойчивость распределения: выполняет runs запусков со случайным порядком студентов
+        и разрешением равенств (seed, seed + 1, ...) в пуле процессов, без записи в базу.
+
+        :return: MonteCarloSummary с частотами назначений студентов и дисперсией числа нераспределенных.
         """
-        if session is None:
-            raise ValueError("Session должна быть передана для обновления данных в базе.")
+        problem = self.load_distribution_problem()
+        summary = run_monte_carlo(problem, runs, solver=solver, seed=seed, workers=workers)
+        logging.info(f"Монте-Карло ({solver}, {runs} запусков): нераспределенных в среднем "
+                     f"{summary.unassigned_mean:.2f}, дисперсия {summary.unassigned_variance:.2f}")
+        return summary
 
-        try:
-            for adv_id, adviser in advisers.items():
-                # Обновляем поле number_of_places в базе данных
-                db_adviser = session.query(Adviser).get(adv_id)
-                if db_adviser:
-                    db_adviser.number_of_places = adviser.number_of_places
-                    logging.debug(
-                        f"Обновлено количество мест для Научного руководителя ID: {adv_id}, Мест: {adviser.number_of_places}")
-            session.commit()
-        except Exception as e:
-            session.rollback()
-            logging.error(f"Ошибка при обновлении количества мест у научных руководителей: {e}")
+    def benchmark_solvers(self, solvers=None, trace_memory=True):
+        """
+        Запускает алгоритмы на одних и тех же входных данных без записи в базу.
 
-    def handle_overbooked_students(self, unassigned_students, student_entries, advisers, adviser_themes,
-                                   adviser_assignments, distributions, session=None):
+        :param solvers: Имена алгоритмов; None — все зарегистрированные.
+        :return: Список SolverReport в порядке запуска.
         """
-        Обрабатывает студентов, у которых все темы заняты, назначая их к наиболее свободному научному руководителю.
+        problem = self.load_distribution_problem()
+        reports = []
+        for name in (solvers if solvers is not None else list(SOLVERS)):
+            _, report = run_solver(name, problem, trace_memory=trace_memory)
+            logging.info(f"Показатели алгоритма {name}: {report.as_dict()}")
+            reports.append(report)
+        return reports
+
+    def save_distribution_result(self, distributions, places, replaced_student_ids=(), replace_all=False):
         """
-        if session is None:
-            raise ValueError("Session должна быть передана для обновления данных в базе.")
+        Записывает распределения и оставшиеся места руководителей одной транзакцией.
+        При ошибке транзакция откатывается, и база остается без изменений.
 
-        for student_id in unassigned_students:
-            available_themes = [theme_id for suit, theme_id, int_level in student_entries[student_id]]
-            available_advisers = [
-                adv_id for adv_id in adviser_themes
-                if set(adviser_themes[adv_id]) & set(available_themes) and advisers[adv_id].number_of_places > 0
-            ]
-
-            if not available_advisers:
-                # Все темы заняты, ищем наиболее свободного научного руководителя
-                most_available_adviser = max(
-                    advisers.values(),
-                    key=lambda adv: (adv.number_of_places, adv.adviser_id)
-                )
-
-                if most_available_adviser.number_of_places > 0:
-                    # Выбираем любую тему, связанную с этим научным руководителем
-                    common_theme = next(theme for theme in adviser_themes[most_available_adviser.adviser_id])
-                    adviser_assignments[most_available_adviser.adviser_id].append(student_id)
-                    distributions.append({
-                        "theme_id": common_theme,
-                        "student_id": student_id,
-                        "adviser_id": most_available_adviser.adviser_id
-                    })
-
-                    # Уменьшаем число мест у научного руководителя
-                    most_available_adviser.number_of_places -= 1
-                    session.commit()
-
-                    logging.info(
-                        f"Студент ID: {student_id} назначен Научному руководителю ID: {most_available_adviser.adviser_id}, "
-                        f"Тема ID: {common_theme}")
-                else:
-                    logging.warning(
-                        f"Невозможно назначить Студента ID: {student_id}, нет свободных мест ни у одного научного руководителя.")
-            else:
-                # Есть доступные места для тем студента
-                best_adv = max(
-                    available_advisers,
-                    key=lambda x: (advisers[x].number_of_places, x)
-                )
-                common_theme = next(theme for theme in adviser_themes[best_adv] if theme in available_themes)
-                adviser_assignments[best_adv].append(student_id)
-                distributions.append({
-                    "theme_id": common_theme,
-                    "student_id": student_id,
-                    "adviser_id": best_adv
-                })
-
-                # Уменьшаем число мест у научного руководителя
-                adviser = advisers[best_adv]
-                adviser.number_of_places -= 1
+        :param distributions: записи {"theme_id", "student_id", "adviser_id"}.
+        :param places: {adviser_id: number_of_places}.
+        :param replaced_student_ids: Студенты, чьи прежние записи распределения нужно удалить.
+        :param replace_all: Удалить все прежние записи распределения (полный пересчет).
+        """
+        with self.Session() as session:
+            try:
+                if replace_all:
+                    session.query(Distribution).delete(synchronize_session=False)
+                elif replaced_student_ids:
+                    session.query(Distribution).filter(
+                        Distribution.student_id.in_(list(replaced_student_ids))
+                    ).delete(synchronize_session=False)
+                self.distribution_repository.add_distribution(distributions, session=session)
+                session.bulk_update_mappings(Adviser, [
+                    {"adviser_id": adviser_id, "number_of_places": number_of_places}
+                    for adviser_id, number_of_places in places.items()
+                ])
+                mark_reference_changed(session, Adviser)
                 session.commit()
+            except Exception as e:
+                session.rollback()
+                logging.error(f"Ошибка при сохранении результата распределения: {e}")
+                raise
 
-                logging.info(
-                    f"Студент ID: {student_id} назначен Научному руководителю ID: {best_adv}, Тема ID: {common_theme}")
 
 class DistributionRepository(BaseRepository):
     def __init__(self, engine):
         super().__init__(engine)
         self.Session = sessionmaker(bind=engine)
 
-    def add_distribution(self, distributions):
-        with self.Session() as session:
-            try:
-                for distribution in distributions:
-                    new_distribution = Distribution(
-                        student_id=distribution["student_id"],
-                        theme_id=distribution["theme_id"],
-                        adviser_id=distribution["adviser_id"],
-                        #interest_level = distribution["interest_level"]
-                    )
-                    session.add(new_distribution)
-                session.commit()
-            except Exception as e:
-                session.rollback()
-                logging.error(f"Ошибка при добавлении распределений: {e}")
+    def add_distribution(self, distributions, session=None):
+        """
+        Добавляет распределения пакетной вставкой. Если передана session, записи только добавляются в нее,
+        а фиксирует транзакцию вызывающий код.
+        """
+        rows = [
+            {
+                "student_id": distribution["student_id"],
+                "theme_id": distribution["theme_id"],
+                "adviser_id": distribution["adviser_id"],
+                #"interest_level": distribution["interest_level"]
+            }
+            for distribution in distributions
+        ]
+        if session is not None:
+            self.bulk_insert(Distribution, rows, session=session)
+            return
+        try:
+            self.bulk_insert(Distribution, rows)
+        except Exception as e:
+            logging.error(f"Ошибка при добавлении распределений: {e}")
 
     def add_distribution_for_app(self,student_id, theme_id, adviser_id):
         with self.Session() as session:
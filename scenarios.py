@@ -0,0 +1,216 @@
+import os
+import random as rnd
+import statistics
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from solvers import SOLVERS, DistributionProblem
+
+# Количество пакетов запусков Монте-Карло на один процесс
+BATCHES_PER_WORKER = 4
+
+# Входные данные, переданные процессу один раз при его запуске
+_shared_problem = None
+
+
+class Scenario:
+    """
+    Сценарий «что если» над загруженными в память входными данными.
+
+    capacity_changes — {adviser_id: изменение числа мест}, например {8: 2} — у руководителя 8 на два места больше,
+    dropped_themes — темы, исключенные из распределения,
+    solver — имя алгоритма из SOLVERS.
+    """
+
+    def __init__(self, name, capacity_changes=None, dropped_themes=(), solver="greedy"):
+        self.name = name
+        self.capacity_changes = capacity_changes or {}
+        self.dropped_themes = set(dropped_themes)
+        self.solver = solver
+
+    def apply(self, problem):
+        """Возвращает копию DistributionProblem с изменениями сценария; исходные данные не меняются."""
+        capacities = dict(problem.capacities)
+        for adviser_id, change in self.capacity_changes.items():
+            capacities[adviser_id] = max(capacities.get(adviser_id, 0) + change, 0)
+        dropped = self.dropped_themes
+        preferences = {
+            student_id: [entry for entry in entries if entry[0] not in dropped]
+            for student_id, entries in problem.preferences.items()
+        }
+        adviser_themes = {
+            adviser_id: [theme_id for theme_id in theme_ids if theme_id not in dropped]
+            for adviser_id, theme_ids in problem.adviser_themes.items()
+        }
+        return DistributionProblem(preferences, capacities, adviser_themes, problem.student_ids)
+
+
+class ScenarioOutcome:
+    """
+    Итог сценария: число распределенных и нераспределенных студентов и гистограмма уровней интереса
+    назначенных тем ({уровень: количество}; 0 — тема вне предпочтений студента).
+    """
+
+    def __init__(self, name, solver, assigned, unassigned, interest_histogram):
+        self.name = name
+        self.solver = solver
+        self.assigned = assigned
+        self.unassigned = unassigned
+        self.interest_histogram = interest_histogram
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "solver": self.solver,
+            "assigned": self.assigned,
+            "unassigned": self.unassigned,
+            "interest_histogram": self.interest_histogram,
+        }
+
+
+def interest_histogram(problem, distributions):
+    """Считает, сколько студентов получили тему каждого уровня интереса."""
+    levels = {
+        student_id: {theme_id: interest_level for theme_id, _, interest_level in entries}
+        for student_id, entries in problem.preferences.items()
+    }
+    return dict(sorted(Counter(
+        levels.get(distribution["student_id"], {}).get(distribution["theme_id"], 0)
+        for distribution in distributions
+    ).items()))
+
+
+def _init_worker(problem):
+    """Инициализатор процесса: входные данные передаются и распаковываются один раз на процесс."""
+    global _shared_problem
+    _shared_problem = problem
+
+
+def _run_scenario(scenario, problem=None):
+    problem = scenario.apply(problem if problem is not None else _shared_problem)
+    result = SOLVERS[scenario.solver](problem)
+    return ScenarioOutcome(scenario.name, scenario.solver, len(result.distributions),
+                           len(result.unassigned_students), interest_histogram(problem, result.distributions))
+
+
+def run_scenarios(problem, scenarios, workers=None):
+    """
+    Выполняет сценарии над копиями входных данных без записи в базу.
+
+    :param workers: Количество процессов; None — по числу ядер, 1 — последовательно в текущем процессе.
+    :return: Список ScenarioOutcome в порядке сценариев.
+    """
+    for scenario in scenarios:
+        if scenario.solver not in SOLVERS:
+            raise ValueError(f"Неизвестный алгоритм распределения: {scenario.solver}")
+    if workers == 1 or len(scenarios) <= 1:
+        return [_run_scenario(scenario, problem) for scenario in scenarios]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(problem,)) as executor:
+        return list(executor.map(_run_scenario, scenarios))
+
+
+def shuffle_problem(problem, seed):
+    """
+    Возвращает копию DistributionProblem со случайным порядком студентов, порядком тем внутри
+    одного студента (разрешение равенств подходимости) и порядком руководителей.
+    """
+    generator = rnd.Random(seed)
+    student_ids = list(problem.preferences)
+    generator.shuffle(student_ids)
+    preferences = {}
+    for student_id in student_ids:
+        entries = list(problem.preferences[student_id])
+        generator.shuffle(entries)
+        preferences[student_id] = entries
+    adviser_ids = list(problem.adviser_themes)
+    generator.shuffle(adviser_ids)
+    adviser_themes = {adviser_id: problem.adviser_themes[adviser_id] for adviser_id in adviser_ids}
+    return DistributionProblem(preferences, problem.capacities, adviser_themes, problem.student_ids)
+
+
+class MonteCarloSummary:
+    """
+    Итог запусков со случайным порядком обработки.
+
+    assignment_frequencies — {student_id: {(adviser_id, theme_id): доля запусков}},
+    unassigned_counts — число нераспределенных студентов в каждом запуске (в порядке seed),
+    unassigned_mean и unassigned_variance — их среднее и дисперсия.
+    """
+
+    def __init__(self, runs, assignment_frequencies, unassigned_counts):
+        self.runs = runs
+        self.assignment_frequencies = assignment_frequencies
+        self.unassigned_counts = unassigned_counts
+        self.unassigned_mean = statistics.fmean(unassigned_counts) if unassigned_counts else 0.0
+        self.unassigned_variance = statistics.pvariance(unassigned_counts) if unassigned_counts else 0.0
+
+    def modal_share(self, student_id):
+        """Доля запусков, в которых студент получил свое самое частое назначение (0 — ни разу не распределен)."""
+        return max(self.assignment_frequencies.get(student_id, {}).values(), default=0.0)
+
+
+def _run_shuffled_batch(solver, seeds, problem=None):
+    """Выполняет пакет запусков и возвращает (Counter назначений, числа нераспределенных)."""
+    problem = problem if problem is not None else _shared_problem
+    solve = SOLVERS[solver]
+    assignments = Counter()
+    unassigned_counts = []
+    for seed in seeds:
+        result = solve(shuffle_problem(problem, seed))
+        assignments.update(
+            (distribution["student_id"], distribution["adviser_id"], distribution["theme_id"])
+            for distribution in result.distributions
+        )
+        unassigned_counts.append(len(result.unassigned_students))
+    return assignments, unassigned_counts
+
+
+def run_monte_carlo(problem, runs, solver="greedy", seed=0, workers=None):
+    """
+    Выполняет runs запусков алгоритма со случайным порядком обработки (seed, seed + 1, ...).
+    Входные данные передаются процессам один раз через инициализатор, в задачах — только номера seed.
+
+    :param workers: Количество процессов; None — по числу ядер, 1 — последовательно в текущем процессе.
+    :return: MonteCarloSummary.
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"Неизвестный алгоритм распределения: {solver}")
+    seeds = list(range(seed, seed + runs))
+
+    if workers == 1 or runs <= 1:
+        batches = [_run_shuffled_batch(solver, seeds, problem)]
+    else:
+        # Непрерывные пакеты seed сохраняют порядок запусков при склейке результатов
+        batch_count = min(runs, (workers or os.cpu_count() or 1) * BATCHES_PER_WORKER)
+        batch_size = -(-runs // batch_count)
+        seed_batches = [seeds[i:i + batch_size] for i in range(0, runs, batch_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(problem,)) as executor:
+            batches = list(executor.map(_run_shuffled_batch, [solver] * len(seed_batches), seed_batches))
+
+    frequencies = defaultdict(dict)
+    unassigned_counts = []
+    totals = Counter()
+    for assignments, counts in batches:
+        totals.update(assignments)
+        unassigned_counts.extend(counts)
+    for (student_id, adviser_id, theme_id), count in totals.items():
+        frequencies[student_id][(adviser_id, theme_id)] = count / runs
+    return MonteCarloSummary(runs, dict(frequencies), unassigned_counts)
+
+
+def format_comparison_table(outcomes):
+    """Форматирует итоги сценариев в текстовую таблицу сравнения."""
+    levels = sorted({level for outcome in outcomes for level in outcome.interest_histogram})
+    header = ["Сценарий", "Алгоритм", "Распределено", "Не распределено"] + [f"Уровень {level}" for level in levels]
+    rows = [
+        [outcome.name, outcome.solver, str(outcome.assigned), str(outcome.unassigned)]
+        + [str(outcome.interest_histogram.get(level, 0)) for level in levels]
+        for outcome in outcomes
+    ]
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in [header] + rows]
+    lines.insert(1, "-" * len(lines[0]))
+    return "\n".join(lines)
@@ -0,0 +1,327 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Максимальная оценка по предмету, относительно которой нормализуется степень подходимости
+MAX_GRADE = 5
+# Количество ячеек интересов, обрабатываемых за один векторизованный шаг
+CELL_CHUNK_SIZE = 65536
+# Количество блоков студентов на один процесс при параллельном расчете
+BLOCKS_PER_WORKER = 4
+
+
+class SparseMatrix:
+    """
+    Разреженная матрица в формате CSR: для строки i ненулевые столбцы лежат
+    в indices[indptr[i]:indptr[i + 1]], значения — в data по тем же позициям.
+    Индексы хранятся в int32, тип значений задается при построении.
+    """
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = shape
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape, dtype, duplicates="sum"):
+        """
+        Строит матрицу из координат ненулевых элементов.
+
+        :param duplicates: Что делать с повторяющимися координатами: "sum", "first" или "last".
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values, dtype=dtype)
+        if len(rows) >= np.iinfo(np.int32).max:
+            raise ValueError("Слишком много ненулевых элементов для индексов int32")
+
+        # lexsort устойчив, поэтому среди дубликатов сохраняется исходный порядок записей
+        order = np.lexsort((cols, rows))
+        rows, cols, values = rows[order], cols[order], values[order]
+        is_first = np.ones(len(rows), dtype=bool)
+        is_first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        starts = np.flatnonzero(is_first)
+
+        if len(rows):
+            if duplicates == "sum":
+                values = np.add.reduceat(values, starts)
+            elif duplicates == "first":
+                values = values[starts]
+            elif duplicates == "last":
+                values = values[np.append(starts[1:], len(rows)) - 1]
+            else:
+                raise ValueError(f"Неизвестный способ обработки дубликатов: {duplicates}")
+        rows, cols = rows[starts], cols[starts]
+
+        indptr = np.zeros(shape[0] + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(indptr, cols.astype(np.int32), values, shape)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+
+    def row(self, i):
+        """Возвращает (индексы столбцов, значения) строки i."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def row_indices(self):
+        """Возвращает номер строки для каждого ненулевого элемента."""
+        return np.repeat(np.arange(self.shape[0], dtype=np.int32), np.diff(self.indptr))
+
+    def to_dense(self, dtype=None):
+        dense = np.zeros(self.shape, dtype=dtype or self.data.dtype)
+        dense[self.row_indices(), self.indices] = self.data
+        return dense
+
+    def pattern(self):
+        """Возвращает плотную булеву матрицу заполненных позиций."""
+        dense = np.zeros(self.shape, dtype=bool)
+        dense[self.row_indices(), self.indices] = True
+        return dense
+
+
+def _rows_to_array(rows, width):
+    """Переводит строки запроса в массив формы (n, width)."""
+    return np.asarray(list(rows), dtype=np.float64).reshape(-1, width)
+
+
+class ScoringInputs:
+    """
+    Исходные данные расчета подходимости в компактном виде:
+    оценки (студенты × предметы, float32), веса (темы × предметы, float64)
+    и интересы (студенты × темы, int8). Оси задаются отсортированными массивами ID.
+    """
+
+    def __init__(self, student_ids, theme_ids, subject_ids, grades, weights, interests):
+        self.student_ids = student_ids
+        self.theme_ids = theme_ids
+        self.subject_ids = subject_ids
+        self.grades = grades
+        self.weights = weights
+        self.interests = interests
+
+    @classmethod
+    def from_rows(cls, grade_rows, importance_rows, interest_rows=()):
+        """
+        :param grade_rows: Строки (student_id, subject_id, grade).
+        :param importance_rows: Строки (theme_id, subject_id, weight).
+        :param interest_rows: Строки (student_id, theme_id, interest_level).
+        """
+        grades = _rows_to_array(grade_rows, 3)
+        importances = _rows_to_array(importance_rows, 3)
+        interests = _rows_to_array(interest_rows, 3)
+
+        student_ids = np.unique(np.concatenate([grades[:, 0], interests[:, 0]]).astype(np.int64))
+        theme_ids = np.unique(np.concatenate([importances[:, 0], interests[:, 1]]).astype(np.int64))
+        subject_ids = np.unique(np.concatenate([grades[:, 1], importances[:, 1]]).astype(np.int64))
+
+        def positions(axis_ids, ids):
+            return np.searchsorted(axis_ids, ids.astype(np.int64))
+
+        # Повторные оценки суммируются, как в исходном построчном алгоритме
+        grade_matrix = SparseMatrix.from_coo(positions(student_ids, grades[:, 0]), positions(subject_ids, grades[:, 1]),
+                                             grades[:, 2], (len(student_ids), len(subject_ids)), np.float32,
+                                             duplicates="sum")
+        # Веса нормализованы и мелко дробятся, поэтому хранятся в float64; при повторе действует последний
+        weight_matrix = SparseMatrix.from_coo(positions(theme_ids, importances[:, 0]),
+                                              positions(subject_ids, importances[:, 1]), importances[:, 2],
+                                              (len(theme_ids), len(subject_ids)), np.float64, duplicates="last")
+        # При повторе интереса учитывается первая запись, как и при прежнем поиске через next(...)
+        interest_matrix = SparseMatrix.from_coo(positions(student_ids, interests[:, 0]),
+                                                positions(theme_ids, interests[:, 1]), interests[:, 2],
+                                                (len(student_ids), len(theme_ids)), np.int8, duplicates="first")
+        return cls(student_ids, theme_ids, subject_ids, grade_matrix, weight_matrix, interest_matrix)
+
+    @property
+    def nbytes(self):
+        return (self.student_ids.nbytes + self.theme_ids.nbytes + self.subject_ids.nbytes
+                + self.grades.nbytes + self.weights.nbytes + self.interests.nbytes)
+
+
+class SuitabilityMatrix:
+    """
+    Матрица степени подходимости студентов к темам (студенты × темы).
+
+    scores хранит нормализованные (в процентах) значения без округления,
+    mask отмечает пары, для которых у студента есть хотя бы одна оценка
+    по предметам темы (только такие пары попадают в словарь совместимости).
+    """
+
+    def __init__(self, student_ids, theme_ids, scores, mask):
+        self.student_ids = np.asarray(student_ids, dtype=np.int64)
+        self.theme_ids = np.asarray(theme_ids, dtype=np.int64)
+        self.scores = scores
+        self.mask = mask
+        self.student_index = {int(student_id): i for i, student_id in enumerate(self.student_ids)}
+        self.theme_index = {int(theme_id): j for j, theme_id in enumerate(self.theme_ids)}
+
+    @classmethod
+    def from_scores(cls, score_rows):
+        """
+        Строит матрицу из готовых нормализованных оценок.
+
+        :param score_rows: Строки (theme_id, student_id, степень подходимости).
+        """
+        score_rows = _rows_to_array(score_rows, 3)
+        theme_ids, theme_pos = np.unique(score_rows[:, 0].astype(np.int64), return_inverse=True)
+        student_ids, student_pos = np.unique(score_rows[:, 1].astype(np.int64), return_inverse=True)
+        scores = np.zeros((len(student_ids), len(theme_ids)), dtype=np.float64)
+        mask = np.zeros(scores.shape, dtype=bool)
+        scores[student_pos, theme_pos] = score_rows[:, 2]
+        mask[student_pos, theme_pos] = True
+        return cls(student_ids, theme_ids, scores, mask)
+
+    def get(self, theme_id, student_id):
+        """Возвращает округленную степень подходимости или None, если пары нет."""
+        i = self.student_index.get(student_id)
+        j = self.theme_index.get(theme_id)
+        if i is None or j is None or not self.mask[i, j]:
+            return None
+        return round(float(self.scores[i, j]), 2)
+
+    def gather(self, student_ids, theme_ids):
+        """
+        Возвращает неокругленные оценки для пар (student_ids[k], theme_ids[k])
+        и булев массив, отмечающий пары, присутствующие в матрице.
+        """
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        theme_ids = np.asarray(theme_ids, dtype=np.int64)
+        scores = np.zeros(len(student_ids), dtype=np.float64)
+        if not len(self.student_ids) or not len(self.theme_ids):
+            return scores, np.zeros(len(student_ids), dtype=bool)
+
+        i = np.minimum(np.searchsorted(self.student_ids, student_ids), len(self.student_ids) - 1)
+        j = np.minimum(np.searchsorted(self.theme_ids, theme_ids), len(self.theme_ids) - 1)
+        valid = (self.student_ids[i] == student_ids) & (self.theme_ids[j] == theme_ids)
+        valid[valid] = self.mask[i[valid], j[valid]]
+        scores[valid] = self.scores[i[valid], j[valid]]
+        return scores, valid
+
+    def to_score_rows(self):
+        """
+        Возвращает неокругленные оценки в виде {(theme_id, student_id): степень подходимости}.
+        """
+        theme_idx, student_idx = np.nonzero(self.mask.T)
+        return dict(zip(zip(self.theme_ids[theme_idx].tolist(), self.student_ids[student_idx].tolist()),
+                        self.scores[student_idx, theme_idx].tolist()))
+
+    def to_dict(self):
+        """
+        Представление в старом формате: {(theme_id, student_id): степень подходимости}.
+        """
+        return {key: round(value, 2) for key, value in self.to_score_rows().items()}
+
+
+def build_suitability_matrix(inputs):
+    """
+    Строит полную матрицу подходимости одним матричным произведением.
+
+    :param inputs: ScoringInputs.
+    :return: SuitabilityMatrix.
+    """
+    grades = inputs.grades.to_dense(np.float64)
+    subject_weights = inputs.weights.to_dense(np.float64).T
+
+    max_possible_scores = subject_weights.sum(axis=0) * MAX_GRADE
+    weighted_grades = grades @ subject_weights
+    scores = np.zeros_like(weighted_grades)
+    np.divide(weighted_grades, max_possible_scores, out=scores, where=max_possible_scores > 0)
+    scores *= 100
+    mask = (inputs.grades.pattern().astype(np.float32) @ inputs.weights.pattern().T.astype(np.float32)) > 0
+
+    return SuitabilityMatrix(inputs.student_ids, inputs.theme_ids, scores, mask)
+
+
+def _score_cells(grades, has_grade, weights, has_weight, students, themes):
+    """
+    Считает подходимость ячеек (students[k], themes[k]) по матрицам, плотным по оси предметов.
+    Функция верхнего уровня, чтобы ее можно было выполнять в пуле процессов.
+    """
+    max_possible_scores = weights.sum(axis=1) * MAX_GRADE
+    scores = np.zeros(len(students), dtype=np.float64)
+    valid = np.zeros(len(students), dtype=bool)
+    for start in range(0, len(students), CELL_CHUNK_SIZE):
+        chunk_students = students[start:start + CELL_CHUNK_SIZE]
+        chunk_themes = themes[start:start + CELL_CHUNK_SIZE]
+        weighted_grades = np.einsum("ij,ij->i", grades[chunk_students].astype(np.float64), weights[chunk_themes])
+        max_scores = max_possible_scores[chunk_themes]
+        chunk_scores = np.zeros(len(chunk_students), dtype=np.float64)
+        np.divide(weighted_grades, max_scores, out=chunk_scores, where=max_scores > 0)
+        scores[start:start + CELL_CHUNK_SIZE] = chunk_scores * 100
+        valid[start:start + CELL_CHUNK_SIZE] = (has_grade[chunk_students] & has_weight[chunk_themes]).any(axis=1)
+    return scores, valid
+
+
+def score_interest_cells(inputs, workers=1):
+    """
+    Вычисляет подходимость только для пар (студент, тема), указанных в интересах.
+
+    :param workers: Количество процессов; при workers > 1 студенты делятся на блоки,
+                    которые считаются в ProcessPoolExecutor и склеиваются в исходном порядке.
+    :return: (оценки, выровненные с inputs.interests.data; булев массив пар,
+             для которых у студента есть оценки по предметам темы).
+    """
+    interests = inputs.interests
+    student_idx = interests.row_indices()
+    theme_idx = interests.indices
+    # Предметов немного, поэтому по оси предметов матрицы хранятся плотно
+    grades = inputs.grades.to_dense(np.float32)
+    has_grade = inputs.grades.pattern()
+    weights = inputs.weights.to_dense(np.float64)
+    has_weight = inputs.weights.pattern()
+
+    if workers <= 1 or not interests.nnz:
+        return _score_cells(grades, has_grade, weights, has_weight, student_idx, theme_idx)
+
+    # Несколько блоков на процесс выравнивают нагрузку; блоки идут по порядку строк CSR
+    row_bounds = np.unique(np.linspace(0, interests.shape[0], workers * BLOCKS_PER_WORKER + 1).astype(np.int64))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for first_row, last_row in zip(row_bounds[:-1].tolist(), row_bounds[1:].tolist()):
+            first_cell, last_cell = interests.indptr[first_row], interests.indptr[last_row]
+            futures.append(executor.submit(
+                _score_cells, grades[first_row:last_row], has_grade[first_row:last_row], weights, has_weight,
+                student_idx[first_cell:last_cell] - first_row, theme_idx[first_cell:last_cell]
+            ))
+        results = [future.result() for future in futures]
+    return (np.concatenate([block_scores for block_scores, _ in results]),
+            np.concatenate([block_valid for _, block_valid in results]))
+
+
+def iter_student_rankings(inputs, scores, valid):
+    """
+    Лениво выдает ранжированные записи студентов из ячеек интересов, по одному студенту за раз.
+
+    :param scores: Оценки подходимости, выровненные с inputs.interests.data.
+    :param valid: Булев массив ячеек, для которых оценка существует.
+    :return: Генератор пар (student_id, [(theme_id, степень подходимости, уровень интереса), ...]),
+             записи каждого студента упорядочены по уровню интереса.
+    """
+    interests = inputs.interests
+    student_idx = interests.row_indices()[valid]
+    theme_idx = interests.indices[valid]
+    levels = interests.data[valid]
+    order = np.lexsort((theme_idx, levels, student_idx))
+    student_idx, theme_idx, levels = student_idx[order], theme_idx[order], levels[order]
+    scores = scores[valid][order]
+
+    # Границы групп одного студента в отсортированных массивах
+    bounds = np.flatnonzero(np.diff(student_idx)) + 1
+    for start, end in zip(np.concatenate([[0], bounds]).tolist(), np.concatenate([bounds, [len(student_idx)]]).tolist()):
+        if start == end:
+            continue
+        entries = [
+            (theme_id, round(suitability_score, 2), interest_level)
+            for theme_id, suitability_score, interest_level in zip(inputs.theme_ids[theme_idx[start:end]].tolist(),
+                                                                   scores[start:end].tolist(),
+                                                                   levels[start:end].tolist())
+        ]
+        yield int(inputs.student_ids[student_idx[start]]), entries
+
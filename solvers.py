@@ -0,0 +1,944 @@
+import heapq
+import logging
+import time
+import tracemalloc
+from array import array
+from collections import defaultdict, deque
+
+# Стоимость дуги студент → руководитель: уровень интереса важнее подходимости,
+# поэтому шаг уровня интереса дороже любого различия в подходимости (0–100 %);
+# подходимость переводится в целые сотые доли процента
+SUITABILITY_COST_SCALE = 100
+LEVEL_COST = 100 * SUITABILITY_COST_SCALE + 1
+# Стоимость темы вне предпочтений студента и отсутствия назначения при локальном поиске:
+# обе дороже любой темы из предпочтений (уровни интереса 1–5)
+OUTSIDE_PREFERENCES_COST = 5 * LEVEL_COST
+UNASSIGNED_COST = 6 * LEVEL_COST
+INFINITY = float("inf")
+
+# Реестр алгоритмов распределения: имя → solve(DistributionProblem) -> SolverResult
+SOLVERS = {}
+
+
+def register_solver(name):
+    """Декоратор, регистрирующий алгоритм распределения под именем name."""
+    def decorator(solve):
+        SOLVERS[name] = solve
+        return solve
+    return decorator
+
+
+class DistributionProblem:
+    """
+    Входные данные распределения, загруженные в память.
+
+    preferences — {student_id: [(theme_id, степень подходимости, уровень интереса), ...]}
+                  или PreferenceTable с тем же интерфейсом чтения (items, [], in, iter),
+    capacities — {adviser_id: количество свободных мест},
+    adviser_themes — {adviser_id: [theme_id, ...]},
+    student_ids — все студенты, включая тех, у кого нет подходящих тем.
+    """
+
+    def __init__(self, preferences, capacities, adviser_themes, student_ids):
+        self.preferences = preferences
+        self.capacities = capacities
+        self.adviser_themes = adviser_themes
+        self.student_ids = student_ids
+
+    def theme_advisers(self):
+        """Возвращает {theme_id: [adviser_id, ...]} в порядке следования руководителей."""
+        theme_advisers = defaultdict(list)
+        for adviser_id, theme_ids in self.adviser_themes.items():
+            for theme_id in theme_ids:
+                theme_advisers[theme_id].append(adviser_id)
+        return theme_advisers
+
+
+class SolverResult:
+    """
+    Результат работы алгоритма распределения.
+
+    distributions — записи {"theme_id", "student_id", "adviser_id"} в формате DistributionRepository.add_distribution,
+    unassigned_students — студенты, оставшиеся без распределения,
+    remaining_places — {adviser_id: оставшиеся места}.
+    """
+
+    def __init__(self, distributions, unassigned_students, remaining_places):
+        self.distributions = distributions
+        self.unassigned_students = unassigned_students
+        self.remaining_places = remaining_places
+
+
+class SolverReport:
+    """
+    Показатели одного запуска алгоритма распределения.
+
+    wall_time — время работы в секундах, peak_memory — пик выделенной памяти в байтах
+    (None, если память не отслеживалась), level_one_share — доля всех студентов, получивших
+    тему первого уровня интереса, mean_suitability — средняя подходимость назначенных тем.
+    """
+
+    def __init__(self, solver, wall_time, peak_memory, assigned, unassigned, level_one_share, mean_suitability):
+        self.solver = solver
+        self.wall_time = wall_time
+        self.peak_memory = peak_memory
+        self.assigned = assigned
+        self.unassigned = unassigned
+        self.level_one_share = level_one_share
+        self.mean_suitability = mean_suitability
+
+    def as_dict(self):
+        return {
+            "solver": self.solver,
+            "wall_time": self.wall_time,
+            "peak_memory": self.peak_memory,
+            "assigned": self.assigned,
+            "unassigned": self.unassigned,
+            "level_one_share": self.level_one_share,
+            "mean_suitability": self.mean_suitability,
+        }
+
+
+def evaluate_distribution(problem, distributions):
+    """
+    Считает показатели качества распределения.
+    :return: (доля студентов с темой первого уровня, средняя подходимость назначенных тем).
+    Тема вне предпочтений студента учитывается с нулевой подходимостью.
+    """
+    entries = {
+        student_id: {theme_id: (suitability, interest_level) for theme_id, suitability, interest_level in student_entries}
+        for student_id, student_entries in problem.preferences.items()
+    }
+    level_one = 0
+    total_suitability = 0.0
+    for distribution in distributions:
+        suitability, interest_level = entries.get(distribution["student_id"], {}).get(
+            distribution["theme_id"], (0.0, None))
+        total_suitability += suitability
+        level_one += interest_level == 1
+    student_count = len(problem.student_ids) or len(distributions)
+    level_one_share = level_one / student_count if student_count else 0.0
+    mean_suitability = total_suitability / len(distributions) if distributions else 0.0
+    return level_one_share, mean_suitability
+
+
+def run_solver(name, problem, trace_memory=False, improve_time_budget=None):
+    """
+    Запускает зарегистрированный алгоритм и измеряет его.
+
+    :param trace_memory: Измерять пик памяти через tracemalloc; замедляет выделение памяти,
+                         поэтому включается только для сравнения алгоритмов.
+    :param improve_time_budget: Если задано, после алгоритма выполняется локальный поиск
+                                (improve_distribution) с этим ограничением времени в секундах;
+                                его время и память входят в показатели.
+    :return: (SolverResult, SolverReport).
+    """
+    if name not in SOLVERS:
+        raise ValueError(f"Неизвестный алгоритм распределения: {name}")
+    solve = SOLVERS[name]
+
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    if trace_memory:
+        tracemalloc.reset_peak()
+        baseline_memory = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        result = solve(problem)
+        if improve_time_budget is not None:
+            result = improve_distribution(problem, result, time_budget=improve_time_budget)
+        wall_time = time.perf_counter() - started
+        peak_memory = tracemalloc.get_traced_memory()[1] - baseline_memory if trace_memory else None
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+    level_one_share, mean_suitability = evaluate_distribution(problem, result.distributions)
+    report = SolverReport(name, wall_time, peak_memory, len(result.distributions), len(result.unassigned_students),
+                          level_one_share, mean_suitability)
+    return result, report
+
+
+class AdviserAvailabilityIndex:
+    """
+    Индекс свободных мест для жадного распределения.
+
+    free — {adviser_id: свободные места}; для каждой темы хранится куча руководителей по их
+    порядку следования, у которых, возможно, есть места (исчерпанные удаляются лениво при чтении).
+    Поиск руководителя стоит O(log число руководителей темы) вместо перебора всех руководителей и тем.
+    """
+
+    def __init__(self, adviser_themes, capacities):
+        self.adviser_themes = adviser_themes
+        self.free = {adviser_id: capacities.get(adviser_id, 0) for adviser_id in adviser_themes}
+        for adviser_id, places in capacities.items():
+            self.free.setdefault(adviser_id, places)
+        self.rank = {adviser_id: rank for rank, adviser_id in enumerate(self.free)}
+        self.theme_advisers = defaultdict(list)
+        self.theme_heaps = defaultdict(list)
+        self.queued = defaultdict(set)
+        for adviser_id, theme_ids in adviser_themes.items():
+            for theme_id in theme_ids:
+                self.theme_advisers[theme_id].append(adviser_id)
+                self._enqueue(theme_id, adviser_id)
+
+    def _enqueue(self, theme_id, adviser_id):
+        if self.free[adviser_id] > 0 and adviser_id not in self.queued[theme_id]:
+            heapq.heappush(self.theme_heaps[theme_id], (self.rank[adviser_id], adviser_id))
+            self.queued[theme_id].add(adviser_id)
+
+    def consume(self, adviser_id):
+        """Занимает одно место у руководителя."""
+        self.free[adviser_id] -= 1
+
+    def release(self, adviser_id):
+        """Освобождает одно место у руководителя и возвращает его в кучи его тем."""
+        self.free[adviser_id] += 1
+        for theme_id in self.adviser_themes.get(adviser_id, ()):
+            self._enqueue(theme_id, adviser_id)
+
+    def first_available(self, theme_id):
+        """Первый по порядку руководитель темы со свободными местами или None."""
+        heap = self.theme_heaps.get(theme_id)
+        while heap:
+            adviser_id = heap[0][1]
+            if self.free[adviser_id] > 0:
+                return adviser_id
+            heapq.heappop(heap)
+            self.queued[theme_id].discard(adviser_id)
+        return None
+
+    def most_free_for_themes(self, theme_ids):
+        """
+        Руководитель с наибольшим числом свободных мест (при равенстве — с большим ID) среди
+        руководителей указанных тем и первая его тема из списка.
+        :return: (adviser_id, theme_id) или None.
+        """
+        wanted = set(theme_ids)
+        candidates = {
+            adviser_id
+            for theme_id in wanted
+            for adviser_id in self.theme_advisers.get(theme_id, ())
+            if self.free[adviser_id] > 0
+        }
+        if not candidates:
+            return None
+        adviser_id = max(candidates, key=lambda candidate: (self.free[candidate], candidate))
+        theme_id = next(theme for theme in self.adviser_themes[adviser_id] if theme in wanted)
+        return adviser_id, theme_id
+
+
+class AssignmentIndex:
+    """
+    Двусторонний индекс текущих назначений жадного распределения:
+    студент → (adviser_id, theme_id, степень подходимости) и руководитель → множество студентов.
+    Назначение, вытеснение и проверка принадлежности выполняются за O(1).
+    """
+
+    def __init__(self):
+        self.by_student = {}
+        self.by_adviser = defaultdict(set)
+
+    def __contains__(self, student_id):
+        return student_id in self.by_student
+
+    def __len__(self):
+        return len(self.by_student)
+
+    def assign(self, student_id, adviser_id, theme_id, suitability):
+        """Назначает студента; ранее назначенный студент сначала вытесняется."""
+        if student_id in self.by_student:
+            self.evict(student_id)
+        self.by_student[student_id] = (adviser_id, theme_id, suitability)
+        self.by_adviser[adviser_id].add(student_id)
+
+    def evict(self, student_id):
+        """Снимает назначение студента и возвращает (adviser_id, theme_id, степень подходимости)."""
+        assignment = self.by_student.pop(student_id)
+        self.by_adviser[assignment[0]].discard(student_id)
+        return assignment
+
+    def get(self, student_id):
+        """Возвращает (adviser_id, theme_id, степень подходимости) или None."""
+        return self.by_student.get(student_id)
+
+    def students_of(self, adviser_id):
+        """Студенты, назначенные руководителю."""
+        return self.by_adviser.get(adviser_id, set())
+
+    def distributions(self):
+        """Записи распределения в формате DistributionRepository.add_distribution, в порядке назначения."""
+        return [
+            {"theme_id": theme_id, "student_id": student_id, "adviser_id": adviser_id}
+            for student_id, (adviser_id, theme_id, _) in self.by_student.items()
+        ]
+
+
+class AdviserPriorityQueues:
+    """
+    Ограниченные очереди назначенных студентов по руководителям: наверху кучи — худший
+    по подходимости студент (при равенстве — с большим ID), поиск стоит O(log number_of_places).
+
+    Вытесненные студенты удаляются лениво: запись хранит версию студента и считается
+    устаревшей, если версия изменилась. Когда устаревших записей становится больше, чем
+    живых, куча перестраивается, поэтому ее размер ограничен местами руководителя,
+    а не числом попыток назначения.
+    """
+
+    def __init__(self, loader=None):
+        """
+        :param loader: Необязательная функция loader(adviser_id) -> [(student_id, theme_id, степень подходимости)],
+                       подгружающая уже назначенных студентов руководителя при первом обращении к его очереди.
+        """
+        self.heaps = defaultdict(list)
+        self.sizes = defaultdict(int)
+        self.versions = defaultdict(int)
+        self.placed = {}
+        self.loader = loader
+        self.loaded = set()
+
+    def push(self, adviser_id, student_id, theme_id, suitability):
+        """Добавляет назначенного студента в очередь руководителя."""
+        if student_id in self.placed:
+            self.remove(student_id)
+        version = self.versions[student_id]
+        heapq.heappush(self.heaps[adviser_id], (suitability, -student_id, version, student_id, theme_id))
+        self.sizes[adviser_id] += 1
+        self.placed[student_id] = adviser_id
+
+    def remove(self, student_id):
+        """Лениво удаляет студента из очереди его руководителя."""
+        adviser_id = self.placed.pop(student_id, None)
+        if adviser_id is None:
+            return
+        self.versions[student_id] += 1
+        self.sizes[adviser_id] -= 1
+        heap = self.heaps[adviser_id]
+        if len(heap) > 2 * self.sizes[adviser_id]:
+            heap[:] = [entry for entry in heap if self._is_current(entry)]
+            heapq.heapify(heap)
+
+    def _is_current(self, entry):
+        return self.versions[entry[3]] == entry[2]
+
+    def worst(self, adviser_id):
+        """Худший студент руководителя: (степень подходимости, student_id, theme_id) или None."""
+        if self.loader is not None and adviser_id not in self.loaded:
+            self.loaded.add(adviser_id)
+            for student_id, theme_id, suitability in self.loader(adviser_id):
+                self.push(adviser_id, student_id, theme_id, suitability)
+        heap = self.heaps.get(adviser_id)
+        while heap:
+            entry = heap[0]
+            if self._is_current(entry):
+                return entry[0], entry[3], entry[4]
+            heapq.heappop(heap)
+        return None
+
+    def size(self, adviser_id):
+        """Число студентов, назначенных руководителю."""
+        return self.sizes.get(adviser_id, 0)
+
+
+class PreferenceTable:
+    """
+    Компактная таблица предпочтений для жадного распределения, строится один раз за запуск.
+
+    Записи всех студентов лежат в параллельных массивах theme_ids, suitabilities и levels;
+    записи одного студента занимают отрезок offsets[student_id] = (start, end) и отсортированы
+    по (уровень интереса, -степень подходимости), поэтому следующая по приоритету тема — это
+    следующий индекс. Если задан loader(student_ids) -> [(student_id, [(theme_id, подходимость, уровень), ...])],
+    записи отсутствующих студентов подгружаются при первом обращении.
+    Для чтения таблица ведет себя как словарь {student_id: [(theme_id, подходимость, уровень), ...]},
+    поэтому может служить preferences в DistributionProblem без второй копии данных.
+    """
+
+    __slots__ = ("theme_ids", "suitabilities", "levels", "offsets", "loader")
+
+    def __init__(self, loader=None):
+        self.theme_ids = array("i")
+        self.suitabilities = array("d")
+        self.levels = array("b")
+        self.offsets = {}
+        self.loader = loader
+
+    @classmethod
+    def from_preferences(cls, preferences, loader=None):
+        """Строит таблицу из потока (student_id, [(theme_id, степень подходимости, уровень интереса), ...])."""
+        table = cls(loader)
+        for student_id, entries in preferences:
+            table.add(student_id, entries)
+        return table
+
+    def add(self, student_id, entries):
+        """Добавляет записи студента (theme_id, степень подходимости, уровень интереса)."""
+        start = len(self.theme_ids)
+        for theme_id, suitability, interest_level in sorted(entries, key=lambda entry: (entry[2], -entry[1])):
+            self.theme_ids.append(theme_id)
+            self.suitabilities.append(suitability)
+            self.levels.append(interest_level)
+        self.offsets[student_id] = (start, len(self.theme_ids))
+
+    def preload(self, student_ids):
+        """Подгружает записи нескольких студентов одним обращением к loader."""
+        missing = [student_id for student_id in student_ids if student_id not in self.offsets]
+        if not missing or self.loader is None:
+            return
+        for student_id, entries in self.loader(missing):
+            if student_id not in self.offsets:
+                self.add(student_id, entries)
+        for student_id in missing:
+            if student_id not in self.offsets:
+                self.add(student_id, ())
+
+    def span(self, student_id):
+        """Отрезок (start, end) записей студента; у студента без записей отрезок пустой."""
+        if student_id not in self.offsets:
+            self.preload([student_id])
+        return self.offsets.get(student_id, (0, 0))
+
+    def theme_ids_of(self, student_id):
+        """Темы студента в порядке приоритета."""
+        start, end = self.span(student_id)
+        return self.theme_ids[start:end].tolist()
+
+    def entries(self, student_id):
+        """Записи студента (theme_id, степень подходимости, уровень интереса) в порядке приоритета."""
+        start, end = self.span(student_id)
+        return list(zip(self.theme_ids[start:end], self.suitabilities[start:end], self.levels[start:end]))
+
+    def items(self):
+        """Пары (student_id, записи студента), как у словаря предпочтений."""
+        for student_id in self.offsets:
+            yield student_id, self.entries(student_id)
+
+    def suitability(self, student_id, theme_id, default=None):
+        """Степень подходимости студента к теме или default, если темы нет среди его предпочтений."""
+        start, end = self.span(student_id)
+        for position in range(start, end):
+            if self.theme_ids[position] == theme_id:
+                return self.suitabilities[position]
+        return default
+
+    def __getitem__(self, student_id):
+        if student_id not in self.offsets:
+            self.preload([student_id])
+        if student_id not in self.offsets:
+            raise KeyError(student_id)
+        return self.entries(student_id)
+
+    def __contains__(self, student_id):
+        return student_id in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+def assign_students(preference_table, availability, adviser_queues, assignments):
+    """
+    Основной цикл для распределения студентов по научным руководителям и темам.
+    Возвращает очередь вытесненных студентов для повторной обработки.
+    """
+    reprocess_queue = deque()
+
+    for student_id in preference_table:
+        if student_id in assignments:
+            continue
+        assign_by_interest_level(
+            student_id, preference_table, availability, adviser_queues, assignments,
+            reprocess_queue
+        )
+    return reprocess_queue
+
+
+def process_reprocess_queue(reprocess_queue, preference_table, availability,
+                            adviser_queues, assignments):
+    while reprocess_queue:
+        student_id = reprocess_queue.popleft()
+        if student_id in assignments:
+            continue
+        assign_by_interest_level(
+            student_id, preference_table, availability, adviser_queues, assignments,
+            reprocess_queue
+        )
+
+
+def assign_by_interest_level(student_id, preference_table, availability, adviser_queues,
+                             assignments, reprocess_queue):
+    """
+    Пробует назначить студента на лучшую по подходимости тему, перебирая уровни интереса по возрастанию.
+    Записи в PreferenceTable уже упорядочены, поэтому лучшая тема уровня — первая запись этого уровня.
+    """
+    start, end = preference_table.span(student_id)
+    theme_ids, suitabilities, levels = (preference_table.theme_ids, preference_table.suitabilities,
+                                        preference_table.levels)
+    attempted_level = None
+    for position in range(start, end):
+        interest_level = levels[position]
+        if interest_level == attempted_level:
+            continue
+        attempted_level = interest_level
+        if assign_with_replacement(
+                student_id,
+                theme_ids[position],
+                suitabilities[position],
+                availability,
+                adviser_queues,
+                assignments,
+                reprocess_queue
+        ):
+            return True
+    return False
+
+
+def assign_with_replacement(student_id, theme_id, suitability, availability,
+                            adviser_queues, assignments, reprocess_queue=None):
+    """
+    Назначает студента на тему к первому руководителю со свободным местом, а если мест нет —
+    вытесняет наименее подходящего студента руководителей этой темы. Вытесненный студент
+    попадает в reprocess_queue.
+    """
+    if reprocess_queue is None:
+        reprocess_queue = deque()
+
+    adv_id = availability.first_available(theme_id)
+
+    if adv_id is not None:
+        assignments.assign(student_id, adv_id, theme_id, suitability)
+        adviser_queues.push(adv_id, student_id, theme_id, suitability)
+
+        # Уменьшаем число мест у научного руководителя
+        availability.consume(adv_id)
+
+        return True
+
+    # Все места руководителей темы заняты: ищем наименее подходящего из их студентов
+    weakest = None
+    for adv_id in availability.theme_advisers.get(theme_id, ()):
+        worst = adviser_queues.worst(adv_id)
+        if worst is not None and (weakest is None or worst[0] < weakest[0]):
+            weakest = (worst[0], worst[1], adv_id)
+    if weakest is None or suitability <= weakest[0]:
+        return False
+
+    _, existing_student, replaced_adv_id = weakest
+    assignments.evict(existing_student)
+    adviser_queues.remove(existing_student)
+
+    # Новый студент занимает освободившееся место того же научного руководителя
+    assignments.assign(student_id, replaced_adv_id, theme_id, suitability)
+    adviser_queues.push(replaced_adv_id, student_id, theme_id, suitability)
+
+    reprocess_queue.append(existing_student)
+    return True
+
+
+def handle_unassigned_students(unassigned_students, preference_table, availability,
+                               assignments):
+    """
+    Обрабатывает студентов, которые остались нераспределенными.
+    Возвращает список студентов, которые так и не были назначены.
+    """
+    remain_students = set()  # Список для хранения оставшихся студентов
+
+    for student_id in unassigned_students:
+        logging.debug(f"Обработка нераспределенного Студента ID: {student_id}")
+
+        available_themes = preference_table.theme_ids_of(student_id)
+        logging.debug(f"Доступные темы для Студента ID: {student_id}: {available_themes}")
+
+        placement = availability.most_free_for_themes(available_themes)
+        if placement is None:
+            logging.debug(f"Нет доступных научных руководителей для Студента ID: {student_id}")
+            remain_students.add(student_id)
+            continue
+
+        best_adv, common_theme = placement
+        logging.debug(
+            f"Студент ID: {student_id} назначен на Тему ID: {common_theme}, Научный руководитель ID: {best_adv}")
+
+        # Назначаем студента
+        suitability = preference_table.suitability(student_id, common_theme)
+        assignments.assign(student_id, best_adv, common_theme, suitability)
+        availability.consume(best_adv)
+
+    return remain_students  # Возвращаем список оставшихся студентов
+
+
+@register_solver("greedy")
+def solve_greedy(problem):
+    """
+    Жадное распределение с заменой. Работает только в памяти на учете свободных мест
+    (AdviserAvailabilityIndex) и не обращается к базе.
+    :return: SolverResult.
+    """
+    preference_table = problem.preferences
+    if not isinstance(preference_table, PreferenceTable):
+        preference_table = PreferenceTable.from_preferences(problem.preferences.items())
+    assignments = AssignmentIndex()
+    availability = AdviserAvailabilityIndex(problem.adviser_themes, problem.capacities)
+    adviser_queues = AdviserPriorityQueues()
+
+    # Распределение студентов
+    reprocess_queue = assign_students(
+        preference_table, availability, adviser_queues, assignments
+    )
+
+    # Обработка очереди повторной обработки
+    process_reprocess_queue(
+        reprocess_queue, preference_table, availability, adviser_queues, assignments
+    )
+
+    unassigned_students = set(problem.student_ids) - set(assignments.by_student)
+
+    # Обработка нераспределенных студентов
+    remain_students = handle_unassigned_students(unassigned_students, preference_table, availability,
+                                                 assignments)
+
+    remaining_places = {adv_id: availability.free[adv_id] for adv_id in problem.capacities}
+    return SolverResult(assignments.distributions(), remain_students, remaining_places)
+
+
+class MinCostFlow:
+    """
+    Поток минимальной стоимости методом последовательных кратчайших путей (primal-dual):
+    кратчайшие расстояния ищутся алгоритмом Дейкстры с потенциалами, после чего по дугам
+    нулевой приведенной стоимости проталкивается блокирующий поток, как в алгоритме Диница.
+    Дуги хранятся параллельными списками, обратная дуга для e — e ^ 1.
+    """
+
+    def __init__(self, node_count):
+        self.node_count = node_count
+        self.adjacency = [[] for _ in range(node_count)]
+        self.heads = []
+        self.capacities = []
+        self.costs = []
+
+    def add_edge(self, tail, head, capacity, cost):
+        """Добавляет дугу и возвращает ее номер."""
+        edge = len(self.heads)
+        self.adjacency[tail].append(edge)
+        self.heads.append(head)
+        self.capacities.append(capacity)
+        self.costs.append(cost)
+        self.adjacency[head].append(edge + 1)
+        self.heads.append(tail)
+        self.capacities.append(0)
+        self.costs.append(-cost)
+        return edge
+
+    def flow(self, edge):
+        """Возвращает поток по дуге (остаточная пропускная способность обратной дуги)."""
+        return self.capacities[edge ^ 1]
+
+    def _shortest_distances(self, source, sink, potentials):
+        """Дейкстра по приведенным стоимостям; останавливается, как только извлечен сток."""
+        distances = [INFINITY] * self.node_count
+        distances[source] = 0
+        heap = [(0, source)]
+        heads, capacities, costs, adjacency = self.heads, self.capacities, self.costs, self.adjacency
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            if node == sink:
+                break
+            node_potential = potentials[node]
+            for edge in adjacency[node]:
+                if capacities[edge] <= 0:
+                    continue
+                head = heads[edge]
+                candidate = distance + costs[edge] + node_potential - potentials[head]
+                if candidate < distances[head]:
+                    distances[head] = candidate
+                    heapq.heappush(heap, (candidate, head))
+        return distances
+
+    def _augment_admissible(self, source, sink, potentials, distances):
+        """Проталкивает блокирующий поток по дугам нулевой приведенной стоимости."""
+        heads, capacities, costs = self.heads, self.capacities, self.costs
+        # Дуги нулевой приведенной стоимости отбираются один раз за фазу и только у вершин,
+        # лежащих не дальше стока; обратные дуги к ним тоже имеют нулевую стоимость,
+        # поэтому остаток пропускной способности проверяется при обходе
+        sink_distance = distances[sink]
+        admissible = [
+            [edge for edge in edges if costs[edge] + potentials[node] - potentials[heads[edge]] == 0]
+            if distances[node] <= sink_distance else []
+            for node, edges in enumerate(self.adjacency)
+        ]
+        total = 0
+        while True:
+            levels = [-1] * self.node_count
+            levels[source] = 0
+            queue = deque([source])
+            while queue:
+                node = queue.popleft()
+                for edge in admissible[node]:
+                    head = heads[edge]
+                    if capacities[edge] > 0 and levels[head] < 0:
+                        levels[head] = levels[node] + 1
+                        queue.append(head)
+            if levels[sink] < 0:
+                return total
+
+            next_edge = [0] * self.node_count
+            while True:
+                # Итеративный поиск пути в слоистой сети с указателями текущих дуг
+                path = []
+                node = source
+                while node != sink:
+                    edges = admissible[node]
+                    edge_count = len(edges)
+                    position = next_edge[node]
+                    while position < edge_count:
+                        edge = edges[position]
+                        if capacities[edge] > 0 and levels[heads[edge]] == levels[node] + 1:
+                            break
+                        position += 1
+                    next_edge[node] = position
+                    if position == edge_count:
+                        if node == source:
+                            break
+                        # Тупик: убираем вершину из слоистой сети и откатываемся
+                        levels[node] = -1
+                        edge = path.pop()
+                        node = heads[edge ^ 1]
+                        next_edge[node] += 1
+                        continue
+                    path.append(edges[position])
+                    node = heads[edges[position]]
+                if node != sink:
+                    break
+                pushed = min(capacities[edge] for edge in path)
+                for edge in path:
+                    capacities[edge] -= pushed
+                    capacities[edge ^ 1] += pushed
+                total += pushed
+
+    def solve(self, source, sink):
+        """
+        Находит максимальный поток минимальной стоимости. Стоимости дуг должны быть неотрицательными.
+        :return: (величина потока, стоимость).
+        """
+        potentials = [0] * self.node_count
+        total_flow = 0
+        while True:
+            distances = self._shortest_distances(source, sink, potentials)
+            sink_distance = distances[sink]
+            if sink_distance == INFINITY:
+                break
+            for node in range(self.node_count):
+                potentials[node] += min(distances[node], sink_distance)
+            total_flow += self._augment_admissible(source, sink, potentials, distances)
+        total_cost = sum(self.costs[edge] * self.flow(edge) for edge in range(0, len(self.heads), 2))
+        return total_flow, total_cost
+
+
+def assignment_cost(suitability, interest_level):
+    """Стоимость назначения студента на тему: сначала уровень интереса, затем подходимость."""
+    return (interest_level - 1) * LEVEL_COST + int(round((100 - suitability) * SUITABILITY_COST_SCALE))
+
+
+@register_solver("min_cost_flow")
+def solve_min_cost_flow(problem):
+    """
+    Оптимальное распределение как поток минимальной стоимости:
+    исток → студент (1) → руководитель через тему студента (1) → сток (number_of_places).
+    Максимизирует число распределенных студентов, затем минимизирует суммарную стоимость.
+    """
+    theme_advisers = problem.theme_advisers()
+    student_ids = list(problem.preferences)
+    adviser_ids = [adviser_id for adviser_id, places in problem.capacities.items() if places > 0]
+    student_nodes = {student_id: i + 1 for i, student_id in enumerate(student_ids)}
+    adviser_nodes = {adviser_id: len(student_ids) + i + 1 for i, adviser_id in enumerate(adviser_ids)}
+    source, sink = 0, len(student_ids) + len(adviser_ids) + 1
+    network = MinCostFlow(sink + 1)
+
+    assignment_edges = []
+    for student_id in student_ids:
+        network.add_edge(source, student_nodes[student_id], 1, 0)
+        # Для пары студент–руководитель оставляем самую дешевую из общих тем
+        best_options = {}
+        for theme_id, suitability, interest_level in problem.preferences[student_id]:
+            cost = assignment_cost(suitability, interest_level)
+            for adviser_id in theme_advisers.get(theme_id, ()):
+                if adviser_id in adviser_nodes and (adviser_id not in best_options
+                                                    or cost < best_options[adviser_id][0]):
+                    best_options[adviser_id] = (cost, theme_id)
+        for adviser_id, (cost, theme_id) in best_options.items():
+            edge = network.add_edge(student_nodes[student_id], adviser_nodes[adviser_id], 1, cost)
+            assignment_edges.append((edge, student_id, theme_id, adviser_id))
+    for adviser_id in adviser_ids:
+        network.add_edge(adviser_nodes[adviser_id], sink, problem.capacities[adviser_id], 0)
+
+    network.solve(source, sink)
+
+    distributions = []
+    remaining_places = dict(problem.capacities)
+    for edge, student_id, theme_id, adviser_id in assignment_edges:
+        if network.flow(edge):
+            distributions.append({"theme_id": theme_id, "student_id": student_id, "adviser_id": adviser_id})
+            remaining_places[adviser_id] -= 1
+    assigned_students = {distribution["student_id"] for distribution in distributions}
+    unassigned_students = set(problem.student_ids) - assigned_students
+    return SolverResult(distributions, unassigned_students, remaining_places)
+
+
+@register_solver("deferred_acceptance")
+def solve_deferred_acceptance(problem):
+    """
+    Отложенное принятие (Гейла–Шепли), предлагают студенты.
+
+    Студент подает заявки по убыванию приоритета (уровень интереса, затем подходимость)
+    всем руководителям своих тем. Руководитель держит ограниченную кучу лучших заявок
+    по подходимости и при переполнении отклоняет худшую. Результат устойчив,
+    сложность O(число заявок × log number_of_places).
+    """
+    theme_advisers = problem.theme_advisers()
+    proposals = {}
+    for student_id, entries in problem.preferences.items():
+        ranked_entries = sorted(entries, key=lambda entry: (entry[2], -entry[1]))
+        proposals[student_id] = [
+            (theme_id, adviser_id, suitability)
+            for theme_id, suitability, _ in ranked_entries
+            for adviser_id in theme_advisers.get(theme_id, ())
+            if problem.capacities.get(adviser_id, 0) > 0
+        ]
+
+    # В куче руководителя наверху худшая заявка: меньшая подходимость, при равенстве — больший ID студента
+    held = defaultdict(list)
+    next_proposal = dict.fromkeys(proposals, 0)
+    free_students = deque(proposals)
+    while free_students:
+        student_id = free_students.popleft()
+        student_proposals = proposals[student_id]
+        while next_proposal[student_id] < len(student_proposals):
+            theme_id, adviser_id, suitability = student_proposals[next_proposal[student_id]]
+            next_proposal[student_id] += 1
+            applicants = held[adviser_id]
+            application = (suitability, -student_id, student_id, theme_id)
+            if len(applicants) < problem.capacities[adviser_id]:
+                heapq.heappush(applicants, application)
+                break
+            if application > applicants[0]:
+                rejected = heapq.heapreplace(applicants, application)
+                free_students.append(rejected[2])
+                break
+
+    distributions = []
+    remaining_places = dict(problem.capacities)
+    for adviser_id, applicants in held.items():
+        for _, _, student_id, theme_id in sorted(applicants, key=lambda application: application[2]):
+            distributions.append({"theme_id": theme_id, "student_id": student_id, "adviser_id": adviser_id})
+        remaining_places[adviser_id] -= len(applicants)
+    assigned_students = {distribution["student_id"] for distribution in distributions}
+    unassigned_students = set(problem.student_ids) - assigned_students
+    return SolverResult(distributions, unassigned_students, remaining_places)
+
+
+def improve_distribution(problem, result, time_budget=1.0):
+    """
+    Локальный поиск поверх готового распределения: переводы студентов на свободные места
+    (или на лучшую тему того же руководителя) и попарные обмены руководителями.
+    Изменение принимается, если уменьшает суммарную стоимость assignment_cost, то есть улучшает
+    сначала уровни интереса, затем подходимость; нераспределенные студенты размещаются на свободные места.
+
+    Для каждого студента заранее считается лучшая тема у каждого руководителя, поэтому изменение
+    стоимости перевода или обмена вычисляется за O(1).
+
+    :param time_budget: Ограничение времени в секундах.
+    :return: Новый SolverResult; исходный результат не меняется.
+    """
+    deadline = time.perf_counter() + time_budget
+    theme_advisers = problem.theme_advisers()
+    theme_costs = {}
+    options = {}
+    for student_id, entries in problem.preferences.items():
+        costs = {theme_id: assignment_cost(suitability, interest_level)
+                 for theme_id, suitability, interest_level in entries}
+        best_options = {}
+        for theme_id, cost in costs.items():
+            for adviser_id in theme_advisers.get(theme_id, ()):
+                if adviser_id not in best_options or cost < best_options[adviser_id][0]:
+                    best_options[adviser_id] = (cost, theme_id)
+        theme_costs[student_id] = costs
+        options[student_id] = best_options
+
+    placement = {}
+    members = defaultdict(set)
+    for distribution in result.distributions:
+        student_id, adviser_id, theme_id = distribution["student_id"], distribution["adviser_id"], distribution["theme_id"]
+        cost = theme_costs.get(student_id, {}).get(theme_id, OUTSIDE_PREFERENCES_COST)
+        placement[student_id] = (adviser_id, theme_id, cost)
+        members[adviser_id].add(student_id)
+    free = dict(result.remaining_places)
+
+    def place(student_id, adviser_id, theme_id, cost):
+        current = placement.get(student_id)
+        if current is not None:
+            members[current[0]].discard(student_id)
+            free[current[0]] = free.get(current[0], 0) + 1
+        placement[student_id] = (adviser_id, theme_id, cost)
+        members[adviser_id].add(student_id)
+        free[adviser_id] = free.get(adviser_id, 0) - 1
+
+    candidates = [student_id for student_id in options if options[student_id]]
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for student_id in candidates:
+            if time.perf_counter() >= deadline:
+                break
+            current = placement.get(student_id)
+            current_adviser, current_cost = (current[0], current[2]) if current else (None, UNASSIGNED_COST)
+
+            # Перевод на свободное место или на лучшую тему того же руководителя
+            best_move = None
+            for adviser_id, (cost, theme_id) in options[student_id].items():
+                if cost < current_cost and (adviser_id == current_adviser or free.get(adviser_id, 0) > 0) \
+                        and (best_move is None or cost < best_move[0]):
+                    best_move = (cost, adviser_id, theme_id)
+            if best_move is not None:
+                cost, adviser_id, theme_id = best_move
+                place(student_id, adviser_id, theme_id, cost)
+                improved = True
+                continue
+            if current is None:
+                continue
+
+            # Обмен руководителями с другим студентом
+            swap = None
+            for adviser_id, (cost, theme_id) in options[student_id].items():
+                if adviser_id == current_adviser:
+                    continue
+                for other_id in members[adviser_id]:
+                    other_option = options.get(other_id, {}).get(current_adviser)
+                    if other_option is None:
+                        continue
+                    delta = cost + other_option[0] - current_cost - placement[other_id][2]
+                    if delta < 0:
+                        swap = (other_id, adviser_id, cost, theme_id, other_option)
+                        break
+                if swap is not None:
+                    break
+            if swap is not None:
+                other_id, adviser_id, cost, theme_id, (other_cost, other_theme) = swap
+                members[current_adviser].discard(student_id)
+                members[adviser_id].discard(other_id)
+                placement[student_id] = (adviser_id, theme_id, cost)
+                placement[other_id] = (current_adviser, other_theme, other_cost)
+                members[adviser_id].add(student_id)
+                members[current_adviser].add(other_id)
+                improved = True
+
+    distributions = [
+        {"theme_id": theme_id, "student_id": student_id, "adviser_id": adviser_id}
+        for student_id, (adviser_id, theme_id, _) in placement.items()
+    ]
+    unassigned_students = set(result.unassigned_students) - set(placement)
+    remaining_places = {adviser_id: free[adviser_id] for adviser_id in result.remaining_places}
+    return SolverResult(distributions, unassigned_students, remaining_places)
@@ -1,7 +1,23 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
+import repositories
+from cache import TTLCache
 from repositories import *
+from factories import RepositoryFactory, dispose_engines, get_engine
+from migrations import ensure_indexes
+from scenarios import Scenario, run_monte_carlo, run_scenarios
+from scoring import ScoringInputs, build_suitability_matrix
+from solvers import (AdviserAvailabilityIndex, AdviserPriorityQueues, AssignmentIndex, DistributionProblem,
+                     SOLVERS, PreferenceTable, SolverResult, assign_with_replacement, improve_distribution,
+                     run_solver, solve_deferred_acceptance, solve_min_cost_flow, solve_greedy)
+from sqlalchemy import create_engine, func, inspect
+from sqlalchemy.orm import Session
+from models import Base
 import logging
+import os
+import random as rnd
+import tempfile
+import threading
 
 # Настройка логирования
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -179,6 +195,624 @@ class TestAlgorithm(unittest.TestCase):
             logging.error(f"Ошибка при выполнении теста: {e}")
             raise
 
+    def test_displaced_student_is_requeued(self):
+        """
+        Вытесненный студент теряет свою запись и попадает в очередь повторной обработки,
+        а новый студент занимает освободившееся место того же руководителя.
+        """
+        availability = AdviserAvailabilityIndex({1: [1]}, {1: 1})
+        assignments = AssignmentIndex()
+        adviser_queues = AdviserPriorityQueues()
+        reprocess_queue = deque()
+
+        for student_id, suitability in ((1, 50.0), (2, 80.0)):
+            self.assertTrue(assign_with_replacement(
+                student_id, 1, suitability, availability, adviser_queues, assignments, reprocess_queue
+            ))
+
+        self.assertEqual(assignments.distributions(), [{"theme_id": 1, "student_id": 2, "adviser_id": 1}])
+        self.assertEqual(list(reprocess_queue), [1])
+        self.assertEqual(availability.free[1], 0)
+        self.assertEqual(adviser_queues.worst(1), (80.0, 2, 1))
+
+
+class TestSuitabilityMatrix(unittest.TestCase):
+    def test_matrix_matches_row_by_row_scoring(self):
+        """
+        Матричный расчет подходимости совпадает с построчным суммированием взвешенных оценок.
+        """
+        grade_rows = [(1, 1, 5), (1, 2, 4), (2, 1, 4), (2, 2, 5), (3, 1, 3)]
+        importance_rows = [(1, 1, 0.8), (1, 2, 0.2), (2, 2, 0.3), (3, 4, 1.0)]
+
+        expected = {}
+        for theme_id, subject_id, weight in importance_rows:
+            for student_id, grade_subject_id, grade in grade_rows:
+                if grade_subject_id == subject_id:
+                    expected[(theme_id, student_id)] = expected.get((theme_id, student_id), 0) + grade * weight
+        for theme_id, student_id in expected:
+            max_possible_score = sum(w * 5 for t, _, w in importance_rows if t == theme_id)
+            expected[(theme_id, student_id)] = round(expected[(theme_id, student_id)] / max_possible_score * 100, 2)
+
+        matrix = build_suitability_matrix(ScoringInputs.from_rows(grade_rows, importance_rows))
+
+        self.assertEqual(matrix.to_dict(), expected)
+        self.assertIsNone(matrix.get(2, 3), "Студент без оценок по предметам темы не должен получать оценку.")
+
+
+class TestSuitabilityScoringModes(unittest.TestCase):
+    def setUp(self):
+        """
+        Подготовка базы данных в памяти со случайными оценками и весами.
+        """
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        generator = rnd.Random(42)
+        with Session(self.engine) as session:
+            for student_id in range(1, 31):
+                for subject_id in range(1, 9):
+                    if generator.random() < 0.9:
+                        session.add(StudentSubjectGrade(student_id=student_id, subject_id=subject_id,
+                                                        grade=generator.randint(3, 5)))
+            for theme_id in range(1, 11):
+                for subject_id in generator.sample(range(1, 10), 4):
+                    session.add(ThemeSubjectImportance(theme_id=theme_id, subject_id=subject_id,
+                                                       weight=generator.uniform(0.1, 1.0)))
+            for student_id in range(1, 31):
+                for interest_level, theme_id in enumerate(generator.sample(range(1, 11), 5), start=1):
+                    session.add(StudentThemeInterest(student_id=student_id, theme_id=theme_id,
+                                                     interest_level=interest_level))
+            session.commit()
+
+        self.distribution_algorithm = DistributionAlgorithmRepository(
+            engine=self.engine,
+            student_subject_grade_repository=StudentSubjectGradeRepository(self.engine, None, None),
+            student_theme_interest_repository=StudentThemeInterestRepository(self.engine, None, None),
+            theme_subject_importance_repository=None,
+            adviser_theme_repository=None,
+            distribution_repository=None
+        )
+
+    def test_sql_mode_matches_python_mode(self):
+        """
+        Расчет подходимости в базе данных дает те же результаты, что и расчет в Python.
+        """
+        python_scores = self.distribution_algorithm.link_theme_subject_importance_with_student_subject_grade("matrix")
+        sql_scores = self.distribution_algorithm.link_theme_subject_importance_with_student_subject_grade("sql")
+
+        self.assertTrue(python_scores)
+        self.assertEqual(sql_scores, python_scores)
+
+    def test_store_mode_recomputes_only_invalidated_cells(self):
+        """
+        После изменения оценки и веса хранилище пересчитывает только затронутые строку и столбец
+        и совпадает с полным пересчетом.
+        """
+        grade_repository = self.distribution_algorithm.student_grade_record_repository
+        importance_repository = ThemeSubjectImportanceRepository(self.engine, None, None)
+        full_count = self.distribution_algorithm.refresh_suitability_store()
+
+        grade_repository.update_student_subject_grade(1, grade=3)
+        importance_repository.add_theme_subject_importance(theme_id=2, subject_id=1, weight=0.9)
+        partial_count = self.distribution_algorithm.refresh_suitability_store()
+
+        self.assertLess(partial_count, full_count)
+        self.assertEqual(self.distribution_algorithm.link_theme_subject_importance_with_student_subject_grade("store"),
+                         self.distribution_algorithm.link_theme_subject_importance_with_student_subject_grade("matrix"))
+
+    def test_invalidations_are_recorded_only_for_filled_store(self):
+        """
+        Пока хранилище подходимости пусто, изменения оценок не оставляют отметок для пересчета.
+        """
+        grade_repository = self.distribution_algorithm.student_grade_record_repository
+        grade_repository.update_student_subject_grade(1, grade=3)
+        with Session(self.engine) as session:
+            self.assertEqual(session.query(SuitabilityScoreInvalidation).count(), 0)
+
+        self.distribution_algorithm.refresh_suitability_store()
+        grade_repository.update_student_subject_grade(1, grade=4)
+        with Session(self.engine) as session:
+            self.assertEqual(session.query(SuitabilityScoreInvalidation).count(), 1)
+
+    def test_parallel_scoring_matches_serial_scoring(self):
+        """
+        Расчет подходимости блоками в пуле процессов совпадает с последовательным расчетом.
+        """
+        serial_rankings = self.distribution_algorithm.rank_student_themes()
+        self.distribution_algorithm.scoring_workers = 2
+        parallel_rankings = self.distribution_algorithm.rank_student_themes()
+
+        self.assertEqual(len(serial_rankings), 30)
+        self.assertEqual(list(parallel_rankings.items()), list(serial_rankings.items()))
+
+
+    def add_advisers(self, places=4):
+        """
+        Добавляет пять руководителей по две темы и подключает репозиторий распределений.
+        """
+        with Session(self.engine) as session:
+            for adviser_id in range(1, 6):
+                session.add(Adviser(adviser_id=adviser_id, username=f"adviser_{adviser_id}", password_hash="",
+                                    firstname="", lastname="", patronymic="", number_of_places=places))
+                for theme_id in (2 * adviser_id - 1, 2 * adviser_id):
+                    session.add(AdviserTheme(adviser_id=adviser_id, theme_id=theme_id))
+            session.commit()
+        self.distribution_algorithm.distribution_repository = DistributionRepository(self.engine)
+
+    def test_analysis_after_run_uses_full_capacity(self):
+        """
+        После сохраненного распределения сценарии считаются от полной вместимости руководителей,
+        а повторный полный запуск заменяет прежние записи, а не добавляет к ним новые.
+        """
+        self.add_advisers()
+        self.distribution_algorithm.assign_students_to_advisers_and_distribute()
+        with Session(self.engine) as session:
+            saved = session.query(Distribution).count()
+
+        problem = self.distribution_algorithm.load_distribution_problem()
+        self.assertEqual(problem.capacities, {adviser_id: 4 for adviser_id in range(1, 6)})
+        outcome, = self.distribution_algorithm.run_scenarios([Scenario("Базовый")], workers=1)
+        self.assertEqual(outcome.assigned, saved)
+
+        self.distribution_algorithm.assign_students_to_advisers_and_distribute()
+        with Session(self.engine) as session:
+            assigned = dict(session.query(Distribution.adviser_id, func.count()).group_by(Distribution.adviser_id))
+            places = dict(session.query(Adviser.adviser_id, Adviser.number_of_places))
+        self.assertEqual(sum(assigned.values()), saved)
+        for adviser_id in range(1, 6):
+            self.assertEqual(places[adviser_id] + assigned.get(adviser_id, 0), 4)
+
+    def test_repair_updates_only_changed_student(self):
+        """
+        После изменения приоритетов одного студента распределение обновляется без полного пересчета:
+        места руководителей остаются согласованными с записями, а у студента ровно одна запись.
+        """
+        self.add_advisers()
+        self.distribution_algorithm.assign_students_to_advisers_and_distribute()
+
+        with Session(self.engine) as session:
+            before = {row.student_id: (row.adviser_id, row.theme_id) for row in session.query(Distribution)}
+            student_id = next(student for student in range(1, 31) if student not in before)
+            session.query(StudentThemeInterest).filter_by(student_id=student_id).delete()
+            session.add(StudentThemeInterest(student_id=student_id, theme_id=1, interest_level=1))
+            session.commit()
+
+        changed = self.distribution_algorithm.repair_distribution_for_student(student_id)
+
+        with Session(self.engine) as session:
+            after = [(row.student_id, row.adviser_id, row.theme_id) for row in session.query(Distribution)]
+            places = dict(session.query(Adviser.adviser_id, Adviser.number_of_places))
+        self.assertEqual(len(after), len({student for student, _, _ in after}))
+        self.assertIn((student_id, 1, 1), after)
+        self.assertEqual({record["student_id"] for record in changed} - {student_id},
+                         {student for student, adviser, theme in after if before.get(student) != (adviser, theme)}
+                         - {student_id})
+        for adviser_id in range(1, 6):
+            self.assertEqual(places[adviser_id] + sum(adviser == adviser_id for _, adviser, _ in after), 4)
+
+    def test_repairs_are_serialised(self):
+        """
+        Обновление распределения ждет, пока завершится другое обновление или полный запуск.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            # Соединения sqlite:// в памяти у каждого потока свои, поэтому база в файле
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'repair.db')}")
+            Base.metadata.create_all(engine)
+            repository = DistributionAlgorithmRepository(engine, None, None, None, None, None)
+            finished = threading.Event()
+            worker = threading.Thread(target=lambda: (repository.repair_distribution_for_student(1), finished.set()))
+            with repositories._distribution_lock:
+                worker.start()
+                self.assertFalse(finished.wait(0.2))
+            worker.join(5)
+            engine.dispose()
+        self.assertTrue(finished.is_set())
+
+    def test_bulk_upsert_updates_existing_and_inserts_new_rows(self):
+        """
+        Пакетное сохранение обновляет записи с существующим ключом и вставляет новые
+        как через ON CONFLICT (ключ с уникальностью), так и через выборку существующих ключей
+        (диалект без ON CONFLICT).
+        """
+        repository = ThemeSubjectImportanceRepository(self.engine, None, None)
+        with Session(self.engine) as session:
+            existing_subject = session.query(ThemeSubjectImportance.subject_id).filter_by(theme_id=1).first()[0]
+            importance_count = session.query(ThemeSubjectImportance).count()
+            session.query(SuitabilityScoreInvalidation).delete()
+            session.commit()
+
+        repository.bulk_upsert(ThemeSubjectImportance, [
+            {"theme_id": 1, "subject_id": existing_subject, "weight": 0.5},
+            {"theme_id": 1, "subject_id": 100, "weight": 0.25},
+        ], key_columns=("theme_id", "subject_id"), chunk_size=1)
+        repository.bulk_upsert(SuitabilityScore, [
+            {"student_id": 1, "theme_id": 1, "score": 10.0},
+            {"student_id": 1, "theme_id": 1, "score": 20.0},
+        ], key_columns=("student_id", "theme_id"))
+        repository.bulk_upsert(SuitabilityScore, [{"student_id": 1, "theme_id": 1, "score": 30.0}],
+                               key_columns=("student_id", "theme_id"))
+
+        with Session(self.engine) as session:
+            weights = dict(session.query(ThemeSubjectImportance.subject_id, ThemeSubjectImportance.weight)
+                           .filter_by(theme_id=1))
+            self.assertEqual(session.query(ThemeSubjectImportance).count(), importance_count + 1)
+            self.assertEqual(weights[existing_subject], 0.5)
+            self.assertEqual(weights[100], 0.25)
+
+        with patch.dict(repositories.UPSERT_DIALECTS, clear=True):
+            repository.bulk_upsert(ThemeSubjectImportance, [
+                {"theme_id": 1, "subject_id": existing_subject, "weight": 0.75},
+                {"theme_id": 1, "subject_id": 100, "weight": 0.125},
+                {"theme_id": 1, "subject_id": 101, "weight": 0.375},
+            ], key_columns=("theme_id", "subject_id"))
+
+        with Session(self.engine) as session:
+            weights = dict(session.query(ThemeSubjectImportance.subject_id, ThemeSubjectImportance.weight)
+                           .filter_by(theme_id=1))
+            self.assertEqual(session.query(ThemeSubjectImportance).count(), importance_count + 2)
+            self.assertEqual(weights[existing_subject], 0.75)
+            self.assertEqual(weights[100], 0.125)
+            self.assertEqual(weights[101], 0.375)
+            self.assertEqual(session.query(SuitabilityScore.score).all(), [(30.0,)])
+            self.assertEqual(set(session.query(SuitabilityScoreInvalidation.theme_id)), {(1,)})
+
+
+class TestEngineRegistry(unittest.TestCase):
+    def test_engine_registry_shares_engine_and_applies_sqlite_profile(self):
+        """
+        Реестр выдает один движок на адрес базы, репозитории фабрики используют его,
+        а соединения SQLite получают настройки WAL, synchronous и busy_timeout.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            db_url = f"sqlite:///{os.path.join(directory, 'registry.db')}"
+            try:
+                engine = get_engine(db_url)
+                self.assertIs(get_engine(db_url), engine)
+                self.assertIs(RepositoryFactory.create_theme_repository(db_url).Session.kw["bind"], engine)
+                with engine.connect() as connection:
+                    self.assertEqual(connection.exec_driver_sql("PRAGMA journal_mode").scalar(), "wal")
+                    self.assertEqual(connection.exec_driver_sql("PRAGMA synchronous").scalar(), 1)
+                    self.assertEqual(connection.exec_driver_sql("PRAGMA busy_timeout").scalar(), 5000)
+            finally:
+                dispose_engines()
+
+
+class TestIndexMigration(unittest.TestCase):
+    def setUp(self):
+        """
+        Пустая база в памяти со схемой из моделей.
+        """
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+
+    def test_ensure_indexes_deduplicates_and_adds_missing_indexes(self):
+        """
+        Миграция удаляет повторы ключа, оставляя последнюю запись, создает недостающий индекс
+        уникальности и при повторном запуске ничего не меняет.
+        """
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql("DROP INDEX uq_student_theme_interests_student_theme")
+            connection.execute(StudentThemeInterest.__table__.insert(), [
+                {"student_id": 1, "theme_id": 100, "interest_level": 1},
+                {"student_id": 1, "theme_id": 100, "interest_level": 3},
+            ])
+
+        ensure_indexes(self.engine)
+        ensure_indexes(self.engine)
+
+        with Session(self.engine) as session:
+            levels = session.query(StudentThemeInterest.interest_level).filter_by(student_id=1, theme_id=100).all()
+        self.assertEqual(levels, [(3,)])
+        index_names = {index["name"] for index in inspect(self.engine).get_indexes("student_theme_interests")}
+        self.assertIn("uq_student_theme_interests_student_theme", index_names)
+        StudentThemeInterestRepository(self.engine, None, None).update_student_theme_interest(1, 100, 5)
+        with Session(self.engine) as session:
+            levels = session.query(StudentThemeInterest.interest_level).filter_by(student_id=1, theme_id=100).all()
+        self.assertEqual(levels, [(5,)])
+
+
+class TestReferenceCache(unittest.TestCase):
+    def setUp(self):
+        """
+        Пустая база в памяти со схемой из моделей.
+        """
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+
+    def test_cache_evicts_least_recently_used_and_expired_entries(self):
+        """
+        При переполнении вытесняется давно не использованная запись, а запись старше ttl загружается заново.
+        """
+        now = [0.0]
+        cache = TTLCache(maxsize=2, ttl=10.0, clock=lambda: now[0])
+        loads = []
+        load = lambda key: cache.get_or_load(key, lambda: loads.append(key) or key)
+        load("a"), load("b"), load("a"), load("c")
+        self.assertEqual(loads, ["a", "b", "c"])
+        load("b")
+        now[0] = 11.0
+        load("a")
+        self.assertEqual(loads, ["a", "b", "c", "b", "a"])
+
+    def test_reference_cache_is_invalidated_by_repository_writes(self):
+        """
+        Запись в обход репозитория не видна до сброса кэша, а запись через репозиторий сбрасывает его сразу.
+        """
+        theme_repository = ThemeRepository(self.engine)
+        self.assertEqual(theme_repository.get_columns(Theme, "theme_id"), [])
+        with self.engine.begin() as connection:
+            connection.execute(Theme.__table__.insert(), {"theme_id": 1, "theme_name": "В обход репозитория"})
+        self.assertEqual(theme_repository.get_columns(Theme, "theme_id"), [])
+        self.assertEqual([theme.theme_id for theme in theme_repository.get_all(Theme)], [1])
+
+        ThemeRepository(self.engine).add_theme_for_app(2, "Новая тема")
+        self.assertEqual(theme_repository.get_columns(Theme, "theme_id"), [(1,), (2,)])
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        """
+        База в памяти с интересами 30 студентов к 5 темам.
+        """
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            session.add_all(StudentThemeInterest(student_id=student_id, theme_id=theme_id, interest_level=theme_id)
+                            for student_id in range(1, 31) for theme_id in range(1, 6))
+            session.commit()
+
+    def test_get_page_walks_primary_key_with_cursor(self):
+        """
+        Страницы по курсору обходят все записи по возрастанию и убыванию ключа без повторов и пропусков.
+        """
+        repository = StudentThemeInterestRepository(self.engine, None, None)
+        with Session(self.engine) as session:
+            all_ids = [row_id for row_id, in session.query(StudentThemeInterest.student_theme_interest_id)
+                       .order_by(StudentThemeInterest.student_theme_interest_id)]
+
+        for order, expected in (("asc", all_ids), ("desc", all_ids[::-1])):
+            seen, cursor = [], None
+            while True:
+                records, cursor = repository.get_page(StudentThemeInterest, cursor, 40, order)
+                seen.extend(record.student_theme_interest_id for record in records)
+                if cursor is None:
+                    break
+            self.assertEqual(seen, expected)
+
+        self.assertEqual(repository.get_page(StudentThemeInterest, all_ids[-1], 40), ([], None))
+        with self.assertRaises(ValueError):
+            repository.get_page(SuitabilityScore)
+
+
+class TestColumnProjection(unittest.TestCase):
+    def setUp(self):
+        """
+        База в памяти с весами предметов для двух тем.
+        """
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            session.add_all(ThemeSubjectImportance(theme_id=theme_id, subject_id=subject_id, weight=subject_id / 10)
+                            for theme_id in (1, 2) for subject_id in range(1, 5))
+            session.commit()
+
+    def test_get_columns_returns_projected_rows(self):
+        """
+        get_columns возвращает кортежи только запрошенных столбцов, в том числе для кэшируемых
+        справочных таблиц, а get_page с columns — проекции вместо ORM-объектов.
+        """
+        repository = ThemeSubjectImportanceRepository(self.engine, None, None)
+        rows = repository.get_columns(ThemeSubjectImportance, "subject_id", "weight", theme_id=1)
+        with Session(self.engine) as session:
+            expected = session.query(ThemeSubjectImportance).filter_by(theme_id=1).all()
+        self.assertEqual(sorted(rows), sorted((record.subject_id, record.weight) for record in expected))
+        self.assertEqual(rows[0]._fields, ("subject_id", "weight"))
+
+        theme_repository = ThemeRepository(self.engine)
+        theme_repository.add_theme_for_app(1, "Первая тема")
+        self.assertEqual(theme_repository.get_columns(Theme, "theme_name"), [("Первая тема",)])
+        theme_repository.add_theme_for_app(2, "Вторая тема")
+        self.assertEqual(theme_repository.get_columns(Theme, "theme_name"), [("Первая тема",), ("Вторая тема",)])
+
+        page, cursor = theme_repository.get_page(Theme, limit=1, columns=("theme_name",))
+        self.assertEqual((page[0].theme_name, cursor), ("Первая тема", 1))
+
+
+class TestSolvers(unittest.TestCase):
+    def setUp(self):
+        """
+        Два руководителя по одному месту; второй студент может получить только тему 1,
+        поэтому первый студент должен уступить ее и перейти на тему 2.
+        """
+        self.problem = DistributionProblem(
+            preferences={
+                1: [(1, 90.0, 1), (2, 80.0, 2)],
+                2: [(1, 70.0, 1)],
+            },
+            capacities={10: 1, 20: 1},
+            adviser_themes={10: [1], 20: [2]},
+            student_ids=[1, 2, 3],
+        )
+
+    def test_min_cost_flow_assigns_maximum_number_of_students(self):
+        """
+        Поток минимальной стоимости распределяет максимум студентов, не превышая места руководителей.
+        """
+        result = solve_min_cost_flow(self.problem)
+
+        assigned = {(d["student_id"], d["theme_id"], d["adviser_id"]) for d in result.distributions}
+        self.assertEqual(assigned, {(1, 2, 20), (2, 1, 10)})
+        self.assertEqual(result.unassigned_students, {3})
+        self.assertEqual(result.remaining_places, {10: 0, 20: 0})
+
+    def test_deferred_acceptance_keeps_best_applicant(self):
+        """
+        При отложенном принятии руководитель оставляет заявку с большей подходимостью,
+        а отклоненный студент без других тем остается нераспределенным.
+        """
+        result = solve_deferred_acceptance(self.problem)
+
+        assigned = {(d["student_id"], d["theme_id"], d["adviser_id"]) for d in result.distributions}
+        self.assertEqual(assigned, {(1, 1, 10)})
+        self.assertEqual(result.unassigned_students, {2, 3})
+        self.assertEqual(result.remaining_places, {10: 0, 20: 1})
+
+
+    def test_availability_index_tracks_free_places(self):
+        """
+        Индекс свободных мест пропускает исчерпанных руководителей и возвращает их после освобождения места.
+        """
+        availability = AdviserAvailabilityIndex({10: [1], 20: [1, 2]}, {10: 1, 20: 2})
+
+        self.assertEqual(availability.first_available(1), 10)
+        availability.consume(10)
+        self.assertEqual(availability.first_available(1), 20)
+        self.assertEqual(availability.most_free_for_themes([2]), (20, 2))
+        availability.release(10)
+        self.assertEqual(availability.first_available(1), 10)
+        availability.consume(20)
+        availability.consume(20)
+        self.assertEqual(availability.most_free_for_themes([1, 2]), (10, 1))
+        self.assertIsNone(availability.most_free_for_themes([2]))
+
+
+    def test_adviser_queues_drop_evicted_students(self):
+        """
+        Очередь руководителя лениво пропускает вытесненных студентов и не растет сверх числа назначенных.
+        """
+        queues = AdviserPriorityQueues()
+        for student_id, suitability in ((1, 40.0), (2, 60.0), (3, 50.0)):
+            queues.push(10, student_id, 1, suitability)
+
+        self.assertEqual(queues.worst(10), (40.0, 1, 1))
+        queues.remove(1)
+        queues.remove(3)
+        self.assertEqual(queues.worst(10), (60.0, 2, 1))
+        self.assertEqual(queues.size(10), 1)
+        self.assertLessEqual(len(queues.heaps[10]), 2)
+        queues.push(20, 2, 2, 70.0)
+        self.assertIsNone(queues.worst(10))
+        self.assertEqual(queues.worst(20), (70.0, 2, 2))
+
+
+    def test_registered_solvers_report_metrics(self):
+        """
+        Все зарегистрированные алгоритмы, включая жадный, запускаются по имени и возвращают показатели.
+        """
+        self.assertTrue({"greedy", "min_cost_flow", "deferred_acceptance"} <= set(SOLVERS))
+        self.assertIs(SOLVERS["greedy"], solve_greedy)
+
+        result, report = run_solver("min_cost_flow", self.problem, trace_memory=True)
+
+        self.assertEqual(report.assigned, len(result.distributions))
+        self.assertEqual(report.unassigned, 1)
+        self.assertAlmostEqual(report.level_one_share, 1 / 3)
+        self.assertAlmostEqual(report.mean_suitability, 75.0)
+        self.assertGreater(report.peak_memory, 0)
+        with self.assertRaises(ValueError):
+            run_solver("unknown", self.problem)
+
+
+    def test_scenarios_run_on_copies(self):
+        """
+        Сценарии меняют только копии входных данных и одинаково считаются последовательно и в процессах.
+        """
+        scenarios = [
+            Scenario("Базовый", solver="min_cost_flow"),
+            Scenario("Плюс место", capacity_changes={10: 1}, solver="min_cost_flow"),
+            Scenario("Без темы 1", dropped_themes=[1], solver="deferred_acceptance"),
+        ]
+
+        outcomes = run_scenarios(self.problem, scenarios, workers=1)
+        parallel_outcomes = run_scenarios(self.problem, scenarios, workers=2)
+
+        self.assertEqual([outcome.as_dict() for outcome in outcomes],
+                         [outcome.as_dict() for outcome in parallel_outcomes])
+        self.assertEqual([(outcome.assigned, outcome.unassigned) for outcome in outcomes], [(2, 1), (2, 1), (1, 2)])
+        self.assertEqual(outcomes[1].interest_histogram, {1: 2})
+        self.assertEqual(outcomes[2].interest_histogram, {2: 1})
+        self.assertEqual(self.problem.capacities, {10: 1, 20: 1})
+
+
+    def test_monte_carlo_matches_serial_runs(self):
+        """
+        Запуски Монте-Карло воспроизводимы по seed и не зависят от числа процессов.
+        """
+        summary = run_monte_carlo(self.problem, 20, solver="greedy", seed=7, workers=1)
+        parallel_summary = run_monte_carlo(self.problem, 20, solver="greedy", seed=7, workers=2)
+
+        self.assertEqual(summary.unassigned_counts, parallel_summary.unassigned_counts)
+        self.assertEqual(summary.assignment_frequencies, parallel_summary.assignment_frequencies)
+        self.assertEqual(len(summary.unassigned_counts), 20)
+        for frequencies in summary.assignment_frequencies.values():
+            self.assertLessEqual(sum(frequencies.values()), 1.0)
+        self.assertEqual(summary.modal_share(3), 0.0)
+
+
+    def test_local_search_swaps_and_fills_free_seats(self):
+        """
+        Локальный поиск меняет студентов местами, если это улучшает уровни интереса,
+        и размещает нераспределенного студента на свободное место.
+        """
+        problem = DistributionProblem(
+            preferences={
+                1: [(1, 90.0, 1), (2, 85.0, 1)],
+                2: [(1, 80.0, 1), (2, 80.0, 2)],
+                3: [(3, 60.0, 1)],
+            },
+            capacities={10: 1, 20: 1, 30: 1},
+            adviser_themes={10: [1], 20: [2], 30: [3]},
+            student_ids=[1, 2, 3],
+        )
+        initial = SolverResult(
+            [{"theme_id": 1, "student_id": 1, "adviser_id": 10}, {"theme_id": 2, "student_id": 2, "adviser_id": 20}],
+            {3}, {10: 0, 20: 0, 30: 1},
+        )
+
+        result = improve_distribution(problem, initial, time_budget=1.0)
+
+        assigned = {(d["student_id"], d["theme_id"], d["adviser_id"]) for d in result.distributions}
+        self.assertEqual(assigned, {(1, 2, 20), (2, 1, 10), (3, 3, 30)})
+        self.assertEqual(result.unassigned_students, set())
+        self.assertEqual(result.remaining_places, {10: 0, 20: 0, 30: 0})
+        self.assertEqual(initial.remaining_places, {10: 0, 20: 0, 30: 1})
+
+
+    def test_preference_table_orders_entries_and_loads_missing_students(self):
+        """
+        Таблица предпочтений упорядочивает записи по (уровень интереса, -подходимость)
+        и подгружает отсутствующих студентов через loader.
+        """
+        loaded = []
+
+        def loader(student_ids):
+            loaded.append(list(student_ids))
+            return [(2, [(3, 50.0, 1)])]
+
+        table = PreferenceTable.from_preferences([(1, [(1, 60.0, 2), (2, 40.0, 1), (3, 90.0, 2)])], loader=loader)
+
+        self.assertEqual(table.theme_ids_of(1), [2, 3, 1])
+        self.assertEqual(table.suitability(1, 3), 90.0)
+        self.assertIsNone(table.suitability(1, 4))
+        self.assertEqual(table.theme_ids_of(2), [3])
+        self.assertEqual(table.span(4), (4, 4))
+        self.assertEqual(loaded, [[2], [4]])
+
+    def test_preference_table_serves_as_problem_preferences(self):
+        """
+        Таблица предпочтений читается как словарь, и все алгоритмы дают на ней тот же результат,
+        что и на словаре.
+        """
+        table = PreferenceTable.from_preferences(self.problem.preferences.items())
+        table_problem = DistributionProblem(table, self.problem.capacities, self.problem.adviser_themes,
+                                            self.problem.student_ids)
+
+        self.assertEqual(dict(table.items()), self.problem.preferences)
+        self.assertEqual(table[2], [(1, 70.0, 1)])
+        with self.assertRaises(KeyError):
+            table[3]
+        for name, solver in SOLVERS.items():
+            self.assertEqual(solver(table_problem).distributions, solver(self.problem).distributions, name)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file